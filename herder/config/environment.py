@@ -2,6 +2,7 @@
 import os
 import logging
 
+from paste.deploy.converters import asbool
 from pylons import config
 import sqlalchemy as sa
 from sqlalchemy import engine_from_config
@@ -12,12 +13,11 @@ import authkit.users.sqlalchemy_04_driver
 import herder.lib.app_globals as app_globals
 import herder.lib.helpers
 from herder.config.routing import make_map
+from herder.lib.roles import CONTEXT_ROLES, RoleSync
 from herder import model
 
 log = logging.getLogger(__name__)
 
-CONTEXT_ROLES = ('administer', 'translate', )
-
 def load_environment(global_conf, app_conf):
     """Configure the Pylons environment via the ``pylons.config``
     object
@@ -41,6 +41,15 @@ def load_environment(global_conf, app_conf):
     # Customize templating options via this variable
     tmpl_options = config['buffet.template_options']
 
+    # keep compiled templates on disk (cache_dir/templates by default) so
+    # restarted workers don't recompile them; filesystem checks can be
+    # turned off where templates only change on deployment
+    if 'herder.templates.module_directory' in config:
+        tmpl_options['mako.module_directory'] = \
+            config['herder.templates.module_directory']
+    tmpl_options['mako.filesystem_checks'] = asbool(
+        config.get('herder.templates.filesystem_checks', True))
+
     # CONFIGURATION OPTIONS HERE (note: all config options will override
     # any Pylons config options)
     config['pylons.g'].sa_engine = engine = \
@@ -52,35 +61,6 @@ def load_environment(global_conf, app_conf):
         [model.setup_model, authkit.users.sqlalchemy_04_driver.setup_model])
     manager.create_all()
 
-    connection = manager.engine.connect()
-    session = manager.session_maker(bind=connection)
-    try:
-        environ = {}
-        environ['sqlalchemy.session'] = session
-        environ['sqlalchemy.model'] = manager.model
-        users = authkit.users.sqlalchemy_04_driver.UsersFromDatabase(environ)
-
-        # sync up the roles for each domain and language
-        for domain in model.Domain.all():
-
-            for cr in CONTEXT_ROLES:
-
-                if not users.role_exists('domain-%s-%s' % (domain.name, cr)):
-                    users.role_create('domain-%s-%s' % (domain.name, cr))
-
-            for lang in domain.languages:
-
-                for cr in CONTEXT_ROLES:
-
-                    if not users.role_exists('lang-%s-%s' % (lang.name, cr)):
-                        users.role_create('lang-%s-%s' % (lang.name, cr))
-
-        # commit the user setup work
-        session.flush()
-        session.commit()
-
-    finally:
-        session.close()
-        connection.close()
-
-
+    config['pylons.g'].role_sync = RoleSync(
+        manager, config.get('herder.roles.sync', 'startup'))
+    config['pylons.g'].role_sync.start()
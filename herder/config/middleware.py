@@ -14,6 +14,8 @@ from authkit.users import sqlalchemy_04_driver
 import authkit.authenticate
 
 from herder.model import setup_model
+from herder.lib.instrument import InstrumentMiddleware, instrument_engine
+from herder.lib.profiler import ProfileMiddleware
 from sqlalchemymanager import SQLAlchemyManager
 
 from herder.config.environment import load_environment
@@ -42,12 +44,19 @@ def make_app(global_conf, full_stack=True, **app_conf):
     # The Pylons WSGI app
     app = PylonsApp()
 
+    # Profile requests on demand; not installed unless enabled
+    if asbool(config.get('herder.profile.enabled', False)):
+        app = ProfileMiddleware(app, config)
+
     # Authentication Layer (AuthKit)
     app = authkit.authenticate.middleware(app, app_conf)
     app = SQLAlchemyManager(app, app_conf, 
                             [setup_model, sqlalchemy_04_driver.setup_model])
 
     # CUSTOM MIDDLEWARE HERE (filtered by error handling middlewares)
+    if asbool(config.get('herder.instrument.enabled', False)):
+        instrument_engine(app.engine)
+        app = InstrumentMiddleware(app)
 
     if asbool(full_stack):
         # Handle Python exceptions
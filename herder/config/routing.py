@@ -20,6 +20,8 @@ def make_map():
     map.connect('', controller='domain', action='list')
     map.connect('domain/all/:action', controller='domain')
     map.connect('domain/:id', controller='domain', action='view')
+    map.connect('domain/:id/stats', controller='domain', action='stats')
+    map.connect('domain/:id/changes', controller='domain', action='changes')
 
     map.connect('domain/:domain/language/:id/',
                 controller='language')
@@ -29,6 +31,9 @@ def make_map():
     map.connect('domain/:domain/language/:language/message/:action/:id',
                 controller='message')
 
+    map.connect('search', controller='search', action='index')
+    map.connect('search/:action', controller='search')
+
     map.connect(':controller/:action/:id/')
     map.connect('*url', controller='template', action='view')
 
@@ -0,0 +1,37 @@
+import logging
+
+from authkit.authorize.pylons_adaptors import authorize
+from paste.deploy.converters import asbool
+
+from herder.lib.base import *
+from herder.lib.authentication import HasContextRole
+import herder.lib.instrument
+
+log = logging.getLogger(__name__)
+
+class AdminController(BaseController):
+
+    @authorize(HasContextRole('administrator'))
+    def index(self):
+        """Link to the administrative pages."""
+
+        c.instrumented = asbool(config.get('herder.instrument.enabled', 
+                                           False))
+
+        return render('/admin/index.html')
+
+    @authorize(HasContextRole('administrator'))
+    @jsonify
+    def stats(self):
+        """Return the per-route request statistics collected by this
+        process, when ``herder.instrument.enabled`` is set."""
+
+        return herder.lib.instrument.collector.snapshot()
+
+    @authorize(HasContextRole('administrator'))
+    def metrics(self):
+        """Return the per-route request statistics in the Prometheus text
+        format."""
+
+        response.headers['Content-Type'] = 'text/plain; version=0.0.4'
+        return herder.lib.instrument.collector.prometheus()
@@ -4,24 +4,82 @@ from authkit.authorize.pylons_adaptors import authorize
 from authkit.permissions import HasAuthKitRole, ValidAuthKitUser
 
 import herder.model
+import herder.model.journal
 from herder.lib.base import *
 
 log = logging.getLogger(__name__)
 
+# the most changes returned by one request, and the longest a request
+# waits for new changes
+CHANGES_LIMIT = 500
+MAX_WAIT = 30
+
 class DomainController(BaseController):
 
     def list(self):
         """Return a list of available translation domains."""
 
         c.domains = herder.model.Domain.all()
-        return render('/domain/list.html')
+
+        versions = [d.name for d in c.domains]
+        self._etag(versions, per_user=True)
+
+        return self._render_cached('/domain/list.html', versions)
 
     def view(self, id):
         """View a specific domain."""
 
         c.domain = herder.model.Domain.by_name(id)
+        versions = [c.domain.name, c.domain.version()]
+        self._etag(versions, per_user=True)
+
         c.languages = c.domain.languages
         c.languages.sort()
+        c.stats = c.domain.stats.languages()
+        c.totals = c.domain.stats.totals()
+
+        return self._render_cached('/domain/view.html', versions)
+
+
+    @jsonify
+    def stats(self, id):
+        """Return the completion statistics of a domain and each of its
+        languages."""
+
+        domain = herder.model.Domain.by_name(id)
+        self._etag([domain.name, domain.version()])
+
+        languages = {}
+        for name, counters in domain.stats.languages().items():
+            languages[name] = dict([(k, v) for k, v in counters.items()
+                                    if k != 'stamp'])
+
+        return dict(domain=domain.name, totals=domain.stats.totals(),
+                    languages=languages)
+
+    @jsonify
+    def changes(self, id):
+        """Return the changes made to a domain after the sequence number
+        ``since`` (default 0), optionally only those to the language
+        ``lang``, at most ``limit`` of them.
+
+        With ``wait``, if there are no such changes the request waits up
+        to that many seconds (at most ``herder.journal.max_wait``) for
+        some to be made.  The result includes ``last_seq``, the sequence
+        number to pass as ``since`` to continue from."""
+
+        domain = herder.model.Domain.by_name(id)
+        journal = herder.model.journal.Journal(domain)
+
+        since = int(request.params.get('since', 0))
+        limit = min(int(request.params.get('limit', CHANGES_LIMIT)),
+                    CHANGES_LIMIT)
+        lang = request.params.get('lang')
+        wait = min(float(request.params.get('wait', 0)),
+                   float(config.get('herder.journal.max_wait', MAX_WAIT)))
 
-        return render('/domain/view.html')
+        changes, last_seq = journal.since(since, limit, lang)
+        if not changes and wait > 0 and journal.wait(last_seq, wait):
+            changes, last_seq = journal.since(last_seq, limit, lang)
 
+        return dict(domain=domain.name, last_seq=last_seq, changes=changes)
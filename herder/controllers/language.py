@@ -2,6 +2,7 @@ import urllib
 import logging
 
 import jsonlib
+import paste.fileapp
 from authkit.authorize.pylons_adaptors import (
     authorize, authorized, authorize_request)
 from authkit.authorize import PermissionError
@@ -11,18 +12,63 @@ from pylons.decorators import jsonify
 from herder.lib.base import *
 import herder.model
 from herder.lib.authentication import HasContextRole
+from herder.model.status import TRANSLATED, UNTRANSLATED, IDENTICAL, \
+     SOURCE_LANGUAGE
+import herder.model.catalog
+import herder.model.memory
+import herder.model.journal
 
 log = logging.getLogger(__name__)
 
+CATALOG_CONTENT_TYPES = {'po':'text/x-gettext-translation',
+                         'mo':'application/x-gettext-translation',
+                         }
+
+# default number of strings the editor requests per page
+PAGE_SIZE = 200
+
+# the updated view lists the latest changes to a language among the last
+# UPDATED_WINDOW changes to its domain
+UPDATED_COUNT = 100
+UPDATED_WINDOW = 5000
+
 class LanguageController(BaseController):
 
+    def _check_etag(self, domain, id, per_user=False, extra=()):
+        """Respond with 304 Not Modified if the language, the source
+        language its status is derived from, any additional languages
+        requested and the extra values the page depends on are unchanged
+        since the client's copy; otherwise return the list of versions
+        the ETag was computed from."""
+
+        domain = herder.model.Domain.by_name(domain)
+        languages = [domain.get_language(id)] + \
+            domain.get_languages(request.params.getall('lang'))
+
+        try:
+            languages.append(domain.get_language(SOURCE_LANGUAGE))
+        except KeyError:
+            pass
+
+        versions = [domain.name, id, str(languages[0].suggestions.stamp())] + \
+            [l.version() for l in languages] + list(extra)
+        self._etag(versions, per_user)
+
+        return versions
+
     def view(self, domain, id):
         """View a specific domain language."""
 
+        versions = self._check_etag(domain, id, per_user=True)
+
         c.domain = herder.model.Domain.by_name(domain)
         c.language = c.domain.get_language(id)
 
-        return render('/language/view.html')
+        counts = c.language.status.counts()
+        c.untranslated_count = counts[UNTRANSLATED] + counts[IDENTICAL]
+        c.suggestion_count = len(c.language.suggestions)
+
+        return self._render_cached('/language/view.html', versions)
 
     @authorize(HasContextRole('administer',  keys=('lang', 'domain'), 
                               id_key='lang'))
@@ -44,6 +90,7 @@ class LanguageController(BaseController):
         c.addl_langs = request.params.getall('lang')
         c.addl_langs_list = ",".join(['"%s"' % n for n in c.addl_langs])
         c.addl_langs_qs = urllib.urlencode([('lang', n) for n in c.addl_langs])
+        c.page_size = int(config.get('herder.page_size', PAGE_SIZE))
 
         return render(template_fn)
 
@@ -55,60 +102,284 @@ class LanguageController(BaseController):
 
         return self._editor(domain, id, '/language/untranslated.html')
 
-    def _messages(self, domain, id, filter=lambda x:True):
+    def updated(self, domain, id):
+        """List the latest changes made to a language."""
+
+        c.domain = herder.model.Domain.by_name(domain)
+        c.language = c.domain.get_language(id)
+
+        journal = herder.model.journal.Journal(c.domain)
+        changes, last_seq = journal.since(
+            max(journal.last_sequence() - UPDATED_WINDOW, 0), language=id)
+
+        c.changes = changes[-UPDATED_COUNT:]
+        c.changes.reverse()
+
+        return render('/language/updated.html')
+
+    def suggestions(self, domain, id):
+        """List the pending suggestions for a language."""
+
+        c.can_translate = self._can_translate(domain, id)
+        c.conflict = request.params.get('conflict')
+        versions = self._check_etag(domain, id, per_user=True, 
+                                    extra=[str(c.can_translate), 
+                                           c.conflict or ''])
+
+        c.domain = herder.model.Domain.by_name(domain)
+        c.language = c.domain.get_language(id)
+
+        values = c.language.values()
+        pending = c.language.suggestions.pending()
+        c.suggestions = [(msg_id, values.get(msg_id, ""), pending[msg_id])
+                         for msg_id in sorted(pending.keys())]
+
+        return self._render_cached('/language/suggestions.html', versions)
+
+    def _resolve_suggestion(self, domain, id, accept):
+
+        if request.method != 'POST':
+            abort(405)
+
+        if not self._can_translate(domain, id):
+            abort(403)
+
+        language = herder.model.DomainLanguage.by_domain_id(domain, id)
+        conflict = None
+
+        try:
+            if accept:
+                language.suggestions.accept(request.params['sid'], 
+                                            request.environ['REMOTE_USER'])
+            else:
+                language.suggestions.reject(request.params['sid'], 
+                                            request.environ['REMOTE_USER'])
+        except KeyError:
+            # already accepted or rejected by someone else
+            pass
+        except herder.model.EditConflict, e:
+            # the message was changed after the suggestion was made
+            conflict = e.ids[0]
+
+        if conflict is None:
+            redirect_to(controller='language', action='suggestions', 
+                        domain=domain, id=id)
+        else:
+            redirect_to(controller='language', action='suggestions', 
+                        domain=domain, id=id, conflict=conflict)
+
+    @authorize(ValidAuthKitUser())
+    def accept_suggestion(self, domain, id):
+        """Store a suggestion as the translation of its message."""
+
+        return self._resolve_suggestion(domain, id, True)
+
+    @authorize(ValidAuthKitUser())
+    def reject_suggestion(self, domain, id):
+        """Discard a suggestion."""
+
+        return self._resolve_suggestion(domain, id, False)
+
+    def _messages(self, domain, id, filter=lambda id, value:True):
+        """Return the strings in a language, joined with any additional
+        languages requested.
+
+        The ``limit`` and ``cursor`` parameters page through the strings
+        in message id order (``sort=-id`` reverses it); ``prefix`` limits
+        the strings to ids starting with a prefix and ``q`` to strings
+        whose id or value contains a substring.  When ``limit`` is
+        provided the result includes ``next_cursor``, which is null on
+        the last page."""
+
         domain = herder.model.Domain.by_name(domain)
-        langs = {id:domain.get_language(id)}
-    
-        for l_id in request.params.getall('lang'):
-            langs[l_id] = domain.get_language(l_id)
-            
+        language = domain.get_language(id)
+        others = domain.get_languages(request.params.getall('lang'))
+
+        limit = int(request.params.get('limit', 0))
+        query = request.params.get('q', '').lower()
+        ids = language.select(prefix=request.params.get('prefix'),
+                              after=request.params.get('cursor'),
+                              reverse=request.params.get('sort') == '-id')
+
         result = dict(domain=domain.name,
-                      language=id,
-                      strings=[])
+                      language=id)
+        if limit:
+            result['next_cursor'] = None
+
+        # find the ids on this page up front so next_cursor is known
+        # before the strings are streamed
+        values = language.values()
+        page = []
+
+        for msg_id in ids:
+            value = values.get(msg_id, "")
 
-        for s in langs[id]:
-            if filter(s):
-                string_record = dict(id=s.id, value=s.string)
+            if not filter(msg_id, value):
+                continue
 
-                for l in langs:
-                    string_record[l] = langs[l][s.id].string
+            if query and query not in msg_id and query not in value.lower():
+                continue
 
-                result['strings'].append(string_record)
+            if limit and len(page) == limit:
+                # there's at least one more match; resume after this page
+                result['next_cursor'] = page[-1]
+                break
+
+            page.append(msg_id)
+
+        result['strings'] = self._string_records(language.join(others, page),
+                                                 language.versions())
 
         return result
 
-    @jsonify
+    def _string_records(self, joined, versions):
+        """Yield a dictionary for each row of a language join."""
+
+        for msg_id, value, values in joined:
+            string_record = dict(id=msg_id, value=value, 
+                                 version=versions.get(msg_id, 0))
+            string_record.update(values)
+
+            yield string_record
+
+    @jsonify_stream
     def strings(self, domain, id):
-        return self._messages(domain, id, lambda s:bool(s.id))
 
-    @jsonify
+        self._check_etag(domain, id)
+        return self._messages(domain, id, lambda msg_id, value:bool(msg_id))
+
+    @jsonify_stream
     def untranslated_strings(self, domain, id):
 
-        en = herder.model.DomainLanguage.by_domain_id(domain, 'en')
+        self._check_etag(domain, id)
 
-        def untrans_filter(message):
-            return (message.id and ( not(message.string) or 
-                                     message.string == en[message.id].string)
-                    )
+        messages = herder.model.DomainLanguage.by_domain_id(
+            domain, id).status.messages()
+
+        def untrans_filter(msg_id, value):
+            return (msg_id and msg_id in messages and 
+                    messages[msg_id][0] != TRANSLATED)
 
         return self._messages(domain, id, untrans_filter)
 
+    @jsonify
+    def translation_memory(self, domain, id):
+        """Return translation memory matches for untranslated strings.
+
+        The strings are given by ``msg`` parameters; without any, the
+        first ``limit`` (default 20) untranslated strings after
+        ``cursor`` are used.  ``k`` sets the number of matches returned
+        for each string."""
+
+        language = herder.model.DomainLanguage.by_domain_id(domain, id)
+
+        ids = request.params.getall('msg')
+        if not ids:
+            messages = language.status.messages()
+            limit = int(request.params.get('limit', 20))
+
+            for msg_id in language.select(after=request.params.get('cursor')):
+                if msg_id in messages and messages[msg_id][0] != TRANSLATED:
+                    ids.append(msg_id)
+                    if len(ids) == limit:
+                        break
+
+        k = int(request.params.get('k', herder.model.memory.DEFAULT_MATCHES))
+
+        return dict(domain=domain, language=id,
+                    matches=herder.model.memory.matches(language, ids, k))
+
+    def download(self, domain, id):
+        """Download the language as a gettext catalog; the ``format``
+        parameter selects a .po (the default) or compiled .mo file."""
+
+        language = herder.model.DomainLanguage.by_domain_id(domain, id)
+
+        format = request.params.get('format', 'po')
+        if format not in CATALOG_CONTENT_TYPES:
+            abort(400)
+
+        fapp = paste.fileapp.FileApp(
+            herder.model.catalog.export(language, format),
+            content_type=CATALOG_CONTENT_TYPES[format],
+            content_disposition='attachment; filename=%s-%s.%s' % (
+                domain, id, format))
+
+        return fapp(request.environ, self.start_response)
+
+    def _can_translate(self, domain, id):
+        """Return True if the logged in user may translate the language
+        id directly, rather than making suggestions."""
+
+        roles = self._get_roles(request.environ)
+
+        return 'translate' in roles or \
+            ('domain-%s-translate' % domain).lower() in roles or \
+            ('lang-%s-translate' % id).lower() in roles
+
+    def _edit_result(self, language, msg_id, status):
+
+        message = language.get_message(msg_id)
+        return dict(id=message.id, status=status, 
+                    value=message.string, version=message.version)
+
     @authorize(ValidAuthKitUser())
+    @jsonify
     def edit_string(self, domain, id):
-        """Edit an individual string."""
+        """Edit an individual string.
+
+        The edit is only stored if the message is still at the version
+        (or, for older clients, has the old_value) it was based on;
+        otherwise the result has a status of "conflict" and carries the
+        current value and version of the message."""
 
         language = herder.model.DomainLanguage.by_domain_id(domain, id)
         
         data = jsonlib.read(request.params['data'])
 
-        # XXX trap an exception here that would be raised if edit conflict
-        if 'translate' in self._get_roles(domain, id):
+        if self._can_translate(domain, id):
             # store the translation
-            language.update(data['id'], data['new_value'], data['old_value'])
+            try:
+                language.update(data['id'], data['new_value'], 
+                                data.get('old_value'), data.get('version'))
+                status = 'ok'
+            except herder.model.EditConflict:
+                status = 'conflict'
         else:
             # store the translation as a suggestion
             language.suggest(request.environ.get("REMOTE_USER", False),
                              data['id'], data['new_value'])
+            status = 'suggested'
+
+        return self._edit_result(language, data['id'], status)
+
+    @authorize(ValidAuthKitUser())
+    @jsonify
+    def edit_strings(self, domain, id):
+        """Edit a list of strings in one request.
 
+        ``data`` is a JSON array of edits, each in the form accepted by
+        edit_string.  The edits which don't conflict are written together,
+        so a whole page of translations costs a single store write; the
+        result lists the outcome of each edit in order."""
 
+        language = herder.model.DomainLanguage.by_domain_id(domain, id)
 
+        edits = jsonlib.read(request.params['data'])
+
+        if self._can_translate(domain, id):
+            conflicts = set(language.edit_many(
+                    [(e['id'], e['new_value'], e.get('old_value'), 
+                      e.get('version')) for e in edits]))
+            statuses = [(e['id'], 
+                         language.get_message(e['id']).id in conflicts and 
+                         'conflict' or 'ok') for e in edits]
+        else:
+            statuses = []
+            for e in edits:
+                language.suggest(request.environ.get("REMOTE_USER", False),
+                                 e['id'], e['new_value'])
+                statuses.append((e['id'], 'suggested'))
+
+        return dict(results=[self._edit_result(language, msg_id, status)
+                             for msg_id, status in statuses])
@@ -0,0 +1,64 @@
+import logging
+
+import herder.model
+import herder.model.search
+from herder.lib.base import *
+
+log = logging.getLogger(__name__)
+
+class SearchController(BaseController):
+
+    def _filter(self, name):
+        """Return the list of values of a filter parameter, which may be
+        repeated or comma separated."""
+
+        return [v.strip() for param in request.params.getall(name)
+                for v in param.split(',') if v.strip()]
+
+    def _results(self):
+        """Run the search described by the request parameters: ``q``,
+        any number of ``domain`` and ``lang`` filters, and ``limit``."""
+
+        query = request.params.get('q', '')
+        if not query.strip():
+            return []
+
+        limit = request.params.get('limit')
+        if limit is not None:
+            limit = int(limit)
+
+        return herder.model.search.search(query,
+            domains=self._filter('domain'),
+            languages=self._filter('lang'),
+            limit=limit)
+
+    def index(self):
+        """Search for strings across domains and languages."""
+
+        c.query = request.params.get('q', '')
+        c.domain_filter = self._filter('domain')
+        c.lang_filter = self._filter('lang')
+        c.domains = herder.model.Domain.all()
+
+        try:
+            c.results = self._results()
+        except herder.model.search.SearchTooLarge, e:
+            c.results = []
+            c.error = str(e)
+
+        return render('/search/index.html')
+
+    @jsonify
+    def strings(self):
+        """Return the search results as JSON."""
+
+        try:
+            results = self._results()
+        except herder.model.search.SearchTooLarge, e:
+            abort(400, str(e))
+
+        return dict(query=request.params.get('q', ''),
+                    strings=[dict(domain=domain, language=lang, 
+                                  id=msg_id, value=value)
+                             for domain, lang, msg_id, value 
+                             in results])
@@ -1,10 +1,164 @@
+import time
 import logging
+import threading
 
+from pylons import config
 from authkit.users import UsersReadOnly
-from authkit.permissions import RequestPermission, HasAuthKitRole
+from authkit.users import sqlalchemy_04_driver
+from authkit.permissions import RequestPermission, HasAuthKitRole, \
+     NotAuthenticatedError, NotAuthorizedError
 
 log = logging.getLogger(__name__)
 
+DEFAULT_ROLE_CACHE_SIZE = 1000
+DEFAULT_ROLE_CACHE_TTL = 60
+
+class RoleCache(object):
+    """A size bounded LRU cache of the roles of each user.
+
+    Entries expire after ``herder.roles.cache_ttl`` seconds, which bounds
+    how long a role change made by another process goes unnoticed;
+    changes made through ``UsersFromDatabase`` in this process take
+    effect immediately."""
+
+    def __init__(self, size=None, ttl=None):
+
+        self._size = size
+        self._ttl = ttl
+        self._entries = {}
+        self._order = []
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+
+        if self._size is not None:
+            return self._size
+
+        return int(config.get('herder.roles.cache_size',
+                              DEFAULT_ROLE_CACHE_SIZE))
+
+    @property
+    def ttl(self):
+
+        if self._ttl is not None:
+            return self._ttl
+
+        return float(config.get('herder.roles.cache_ttl',
+                                DEFAULT_ROLE_CACHE_TTL))
+
+    def get(self, user):
+        """Return the cached roles for user, or None."""
+
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(user)
+            if entry is None:
+                return None
+
+            self._order.remove(user)
+            if time.time() - entry[0] > self.ttl:
+                del self._entries[user]
+                return None
+
+            self._order.append(user)
+            return entry[1]
+        finally:
+            self._lock.release()
+
+    def put(self, user, roles):
+        """Cache the roles for user, evicting the least recently used
+        entries if the cache is full."""
+
+        self._lock.acquire()
+        try:
+            if user in self._entries:
+                self._order.remove(user)
+
+            self._entries[user] = (time.time(), roles)
+            self._order.append(user)
+
+            while len(self._order) > self.size:
+                del self._entries[self._order.pop(0)]
+        finally:
+            self._lock.release()
+
+    def invalidate(self, user=None):
+        """Drop the cached roles for user, or for every user if user is
+        None."""
+
+        self._lock.acquire()
+        try:
+            if user is None:
+                self._entries.clear()
+                self._order = []
+            elif user in self._entries:
+                del self._entries[user]
+                self._order.remove(user)
+        finally:
+            self._lock.release()
+
+# the per-process cache of user roles
+role_cache = RoleCache()
+
+def user_roles(environ):
+    """Return the set of (lower case) roles of the logged in user, or an
+    empty set if no one is logged in.
+
+    The roles are looked up once per request, and then only when the
+    user's entry in the role cache is missing or has expired."""
+
+    if 'herder.roles' not in environ:
+        user = environ.get('REMOTE_USER')
+
+        if not user:
+            roles = frozenset()
+        else:
+            user = user.lower()
+            roles = role_cache.get(user)
+
+            if roles is None:
+                roles = frozenset(
+                    environ['authkit.users'].user_roles(user))
+                role_cache.put(user, roles)
+
+        environ['herder.roles'] = roles
+
+    return environ['herder.roles']
+
+class UsersFromDatabase(sqlalchemy_04_driver.UsersFromDatabase):
+    """The AuthKit SQLAlchemy users driver, invalidating cached roles
+    when they are changed."""
+
+    def user_delete(self, username):
+
+        sqlalchemy_04_driver.UsersFromDatabase.user_delete(self, username)
+        role_cache.invalidate(username.lower())
+
+    def role_delete(self, role):
+
+        sqlalchemy_04_driver.UsersFromDatabase.role_delete(self, role)
+        role_cache.invalidate()
+
+    def user_set_username(self, username, new_username):
+
+        sqlalchemy_04_driver.UsersFromDatabase.user_set_username(
+            self, username, new_username)
+        role_cache.invalidate(username.lower())
+        role_cache.invalidate(new_username.lower())
+
+    def user_add_role(self, username, role, auto_add_role=False):
+
+        sqlalchemy_04_driver.UsersFromDatabase.user_add_role(
+            self, username, role, auto_add_role)
+        role_cache.invalidate(username.lower())
+
+    def user_remove_role(self, username, role):
+
+        sqlalchemy_04_driver.UsersFromDatabase.user_remove_role(
+            self, username, role)
+        role_cache.invalidate(username.lower())
+
 class HasContextRole(RequestPermission):
 
     def __init__(self, role, all=False, keys=[], id_key=None):
@@ -33,7 +187,17 @@ class HasContextRole(RequestPermission):
                                            self.role)
                              )
 
-        # defer to the included permission checker
-        return HasAuthKitRole(roles, all=self.all).check(
-            app, environ, start_response)
+        if not environ.get('REMOTE_USER'):
+            raise NotAuthenticatedError('Not authenticated')
+
+        # check against the cached roles rather than querying each one
+        has_roles = [r.lower() in user_roles(environ) for r in roles]
+        if self.all and False in has_roles:
+            raise NotAuthorizedError(
+                "User doesn't have all of the specified roles")
+        if not self.all and True not in has_roles:
+            raise NotAuthorizedError(
+                "User doesn't have any of the specified roles")
+
+        return app(environ, start_response)
 
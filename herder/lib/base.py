@@ -3,6 +3,13 @@
 Provides the BaseController class for subclassing, and other objects
 utilized by Controllers.
 """
+try:
+    from hashlib import md5
+except ImportError:
+    # Python 2.4
+    from md5 import new as md5
+
+from paste.deploy.converters import asbool
 from pylons import c, cache, config, g, request, response, session
 from pylons.controllers import WSGIController
 from pylons.controllers.util import abort, etag_cache, redirect_to
@@ -10,24 +17,56 @@ from pylons.decorators import jsonify, validate
 from pylons.i18n import _, ungettext, N_
 from pylons.templating import render
 
-from herder.lib.decorators import with_user_info
+from herder.lib.decorators import with_user_info, jsonify_stream
+from herder.lib.authentication import user_roles
+from herder.lib.instrument import timed_render
+from herder.lib.roles import route_domain
 
 import herder.lib.helpers as h
 import herder.model as model
 
+render = timed_render(render)
+
 class BaseController(WSGIController):
 
     def _get_roles(self, environ):
         """Return a list of roles for the current context."""
 
-        authkit = environ.get('authkit.users')
-        user = environ.get('REMOTE_USER', None)
-        
-        if user is None:
-            # not logged in, no roles
-            return []
+        return sorted(user_roles(environ))
+
+    def _etag(self, versions, per_user=False):
+        """Set the ETag of the response from a sequence of version tokens;
+        if the request's If-None-Match matches, respond with 304 Not
+        Modified.  Pages which vary with the logged in user (anything
+        rendered with the actions menu) should pass per_user; their ETag
+        includes the user's roles, so it changes when a role is granted
+        or revoked."""
+
+        key = list(versions)
+        if per_user:
+            key.append(request.environ.get('REMOTE_USER', ''))
+            key.append(','.join(self._get_roles(request.environ)))
+
+        etag_cache('"%s"' % md5('|'.join(key)).hexdigest())
 
-        return authkit.user_roles(user)
+    def _render_cached(self, template, versions):
+        """Render template, caching the result when
+        ``herder.render_cache.enabled`` is set.
+
+        The result is cached under the template, the sequence of data
+        versions it was rendered from and the user-dependent actions in
+        the page header, so a cached page is never served after its data
+        has changed or to a user who would see a different menu."""
+
+        if not asbool(config.get('herder.render_cache.enabled', False)):
+            return render(template)
+
+        key = [template] + list(versions) + [repr(c.actions)]
+
+        return render(template,
+            cache_key=md5('|'.join(key)).hexdigest(),
+            cache_type=config.get('herder.render_cache.type', 'memory'),
+            cache_expire=int(config.get('herder.render_cache.expire', 3600)))
 
     def _actions(self, environ):
         """Return a sequence of two-tuples describing the actions for this
@@ -35,6 +74,7 @@ class BaseController(WSGIController):
 
         actions = [
             ('/domain/all/list', 'Translation Domains'),
+            ('/search', 'Search'),
             ]
 
         if 'administrator' in self._get_roles(environ):
@@ -46,6 +86,9 @@ class BaseController(WSGIController):
     def __call__(self, environ, start_response):
         """Invoke the Controller"""
 
+        # create the roles of a lazily synced domain before they're checked
+        g.role_sync.ensure(route_domain(environ['pylons.routes_dict']))
+
         # bind the actions method into the context
         c.roles = self._get_roles(environ)
         c.actions = self._actions(environ)
@@ -1,6 +1,12 @@
+import types
+
+import simplejson
 from decorator import decorator
 from pylons import c, cache, config, g, request, response, session
 
+# approximate size of each chunk written by jsonify_stream
+JSON_CHUNK_SIZE = 8192
+
 @decorator
 def with_user_info(fn, *args, **kwargs):
     """Inject information about the logged in user and global roles 
@@ -11,3 +17,68 @@ def with_user_info(fn, *args, **kwargs):
 
     return fn(*args, **kwargs)
 
+
+@decorator
+def jsonify_stream(fn, *args, **kwargs):
+    """Action decorator that streams the JSON encoding of the returned
+    dictionary.
+
+    Generators in the returned value are encoded as arrays an item at a
+    time and written out in chunks, so neither the complete list nor
+    its serialization is held in memory.  The output is identical to
+    what ``jsonify`` produces for the same data with lists in place of
+    generators; anything the generators need from the request must be
+    read before the action returns."""
+
+    response.headers['Content-Type'] = 'text/javascript'
+    return iterencode(fn(*args, **kwargs))
+
+def iterencode(data, chunk_size=JSON_CHUNK_SIZE):
+    """Yield the JSON encoding of data in chunks of roughly chunk_size
+    bytes."""
+
+    chunk = []
+    size = 0
+
+    for part in _iterencode(data):
+        chunk.append(part)
+        size += len(part)
+
+        if size >= chunk_size:
+            yield "".join(chunk)
+            chunk = []
+            size = 0
+
+    if chunk:
+        yield "".join(chunk)
+
+def _iterencode(data):
+
+    if isinstance(data, dict):
+        yield '{'
+
+        for i, (key, value) in enumerate(data.iteritems()):
+            if i:
+                yield ', '
+            yield simplejson.dumps(key)
+            yield ': '
+
+            for part in _iterencode(value):
+                yield part
+
+        yield '}'
+
+    elif isinstance(data, types.GeneratorType):
+        yield '['
+
+        for i, item in enumerate(data):
+            if i:
+                yield ', '
+
+            for part in _iterencode(item):
+                yield part
+
+        yield ']'
+
+    else:
+        yield simplejson.dumps(data)
@@ -4,3 +4,13 @@ Consists of functions to typically be used within templates, but also
 available to Controllers. This module is available to both as 'h'.
 """
 from webhelpers import *
+import time
+
+def format_timestamp(timestamp):
+    """Format a Unix timestamp for display; returns an empty string for
+    a missing (zero) timestamp."""
+
+    if not timestamp:
+        return ''
+
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(timestamp))
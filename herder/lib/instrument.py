@@ -0,0 +1,269 @@
+"""Per-route request timing and I/O counters.
+
+``InstrumentMiddleware`` times every request routed to a controller and
+collects the counters recorded by ``herder.model.counters`` while it is
+handled: the filesystem operations of the model, the database queries
+made through an engine passed to ``instrument_engine`` and the time
+spent rendering templates.  The results are aggregated per route
+(``controller/action``) in the process-wide ``collector`` and served by
+the admin controller, as JSON or in the Prometheus text format.
+
+Instrumentation is enabled with ``herder.instrument.enabled``.
+"""
+import time
+import threading
+
+from herder.model import counters
+
+# upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0)
+
+# counters whose values are times in seconds
+TIME_COUNTERS = ('db_seconds', 'render_seconds')
+
+class Histogram(object):
+    """A histogram of observed values, in fixed buckets."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Return a list of (upper bound, count of values <= bound) pairs,
+        ending with the +Inf bucket."""
+
+        result = []
+        total = 0
+        for bound, n in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += n
+            result.append((bound, total))
+
+        return result
+
+class RouteStats(object):
+    """The aggregated statistics of the requests to one route."""
+
+    def __init__(self):
+
+        self.requests = 0
+        self.errors = 0
+        self.latency = Histogram()
+        self.counters = {}
+
+    def record(self, elapsed, status, counts):
+
+        self.requests += 1
+        if status >= 500:
+            self.errors += 1
+
+        self.latency.observe(elapsed)
+        for name, n in counts.items():
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_dict(self):
+
+        return dict(requests=self.requests, errors=self.errors,
+                    latency=dict(sum=self.latency.sum,
+                                 buckets=[[str(bound), n] for bound, n in
+                                          self.latency.cumulative()]),
+                    counters=dict(self.counters))
+
+class Collector(object):
+    """Aggregates request statistics by route."""
+
+    def __init__(self):
+
+        self.started = time.time()
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, elapsed, status, counts):
+        """Record a request to route which took elapsed seconds."""
+
+        self._lock.acquire()
+        try:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = RouteStats()
+
+            stats.record(elapsed, status, counts)
+        finally:
+            self._lock.release()
+
+    def snapshot(self):
+        """Return the statistics of every route as a dictionary."""
+
+        self._lock.acquire()
+        try:
+            routes = dict([(route, stats.as_dict()) for route, stats in
+                           self._routes.items()])
+        finally:
+            self._lock.release()
+
+        return dict(started=self.started, routes=routes)
+
+    def prometheus(self):
+        """Return the statistics in the Prometheus text exposition
+        format."""
+
+        routes = self.snapshot()['routes']
+        lines = ['# TYPE herder_request_seconds histogram']
+
+        for route in sorted(routes):
+            stats = routes[route]
+            for bound, n in stats['latency']['buckets']:
+                lines.append('herder_request_seconds_bucket{route="%s",'
+                             'le="%s"} %d' % (route, bound, n))
+            lines.append('herder_request_seconds_sum{route="%s"} %f' % (
+                    route, stats['latency']['sum']))
+            lines.append('herder_request_seconds_count{route="%s"} %d' % (
+                    route, stats['requests']))
+
+        lines.append('# TYPE herder_request_errors_total counter')
+        for route in sorted(routes):
+            lines.append('herder_request_errors_total{route="%s"} %d' % (
+                    route, routes[route]['errors']))
+
+        lines.append('# TYPE herder_operations_total counter')
+        for route in sorted(routes):
+            for name, n in sorted(routes[route]['counters'].items()):
+                if name not in TIME_COUNTERS:
+                    lines.append('herder_operations_total{route="%s",'
+                                 'operation="%s"} %d' % (route, name, n))
+
+        lines.append('# TYPE herder_time_seconds_total counter')
+        for route in sorted(routes):
+            for name, n in sorted(routes[route]['counters'].items()):
+                if name in TIME_COUNTERS:
+                    lines.append('herder_time_seconds_total{route="%s",'
+                                 'kind="%s"} %f' % (route, name[:-8], n))
+
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Discard the statistics collected so far."""
+
+        self._lock.acquire()
+        try:
+            self._routes = {}
+            self.started = time.time()
+        finally:
+            self._lock.release()
+
+# the per-process collector
+collector = Collector()
+
+def route_name(environ):
+    """Return the name statistics for a request are recorded under."""
+
+    routes_dict = environ.get('pylons.routes_dict')
+    if not routes_dict or 'controller' not in routes_dict:
+        return 'unrouted'
+
+    return '%s/%s' % (routes_dict['controller'],
+                      routes_dict.get('action', 'index'))
+
+class InstrumentMiddleware(object):
+    """Record the time taken and the counters collected by each request;
+    the request is complete when its response has been read."""
+
+    def __init__(self, app, collector=collector):
+
+        self.app = app
+        self.collector = collector
+
+    def __call__(self, environ, start_response):
+
+        status = []
+        def instrumented_start_response(status_line, headers,
+                                        exc_info=None):
+            status[:] = [int(status_line.split()[0])]
+            return start_response(status_line, headers, exc_info)
+
+        start = time.time()
+        counters.start()
+        try:
+            app_iter = self.app(environ, instrumented_start_response)
+        except:
+            self.collector.record(route_name(environ), time.time() - start,
+                                  500, counters.stop())
+            raise
+
+        return InstrumentedResponse(app_iter, self.collector, environ,
+                                    start, status)
+
+class InstrumentedResponse(object):
+    """Wraps a response's iterable, recording the request when it is
+    closed."""
+
+    def __init__(self, app_iter, collector, environ, start, status):
+
+        self.app_iter = app_iter
+        self.collector = collector
+        self.environ = environ
+        self.start = start
+        self.status = status
+
+    def __iter__(self):
+
+        return iter(self.app_iter)
+
+    def close(self):
+
+        try:
+            if hasattr(self.app_iter, 'close'):
+                self.app_iter.close()
+        finally:
+            self.collector.record(route_name(self.environ),
+                                  time.time() - self.start,
+                                  (self.status or [500])[0], counters.stop())
+
+def instrument_engine(engine):
+    """Count the queries made through a SQLAlchemy engine, and the time
+    spent executing them."""
+
+    dialect = engine.dialect
+
+    def counted(execute):
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return execute(*args, **kwargs)
+            finally:
+                counters.count('db_queries')
+                counters.count('db_seconds', time.time() - start)
+
+        return wrapper
+
+    dialect.do_execute = counted(dialect.do_execute)
+    dialect.do_executemany = counted(dialect.do_executemany)
+
+def timed_render(render):
+    """Return a version of the render function which counts the
+    templates rendered and the time spent rendering them."""
+
+    def wrapper(*args, **kwargs):
+        start = time.time()
+        try:
+            return render(*args, **kwargs)
+        finally:
+            counters.count('renders')
+            counters.count('render_seconds', time.time() - start)
+
+    return wrapper
@@ -0,0 +1,107 @@
+"""On-demand profiling of individual requests.
+
+When ``herder.profile.enabled`` is set, ``ProfileMiddleware`` runs a
+request under the profiler if an administrator asks for it, with a
+``__profile`` query parameter or an ``X-Herder-Profile`` header, or if
+it is picked by ``herder.profile.sample_rate`` (the fraction of all
+requests to profile, 0 by default).  The profile of each request is
+written to ``herder.profile.directory`` (``cache_dir/profiles`` by
+default), named after the time, route and duration of the request, for
+example::
+
+  20081014-153012.123456-4242-language.strings-850ms.prof
+
+Only the latest ``herder.profile.keep`` profiles are kept (all of them
+if it is 0); they can be read with the ``pstats`` module.  When
+profiling isn't enabled the middleware isn't installed at all.
+"""
+import os
+import cgi
+import time
+import random
+import logging
+try:
+    from cProfile import Profile
+except ImportError:
+    # Python 2.4
+    from profile import Profile
+
+from herder.lib.authentication import user_roles
+from herder.lib.instrument import route_name
+
+log = logging.getLogger(__name__)
+
+DEFAULT_KEEP = 100
+PROFILE_SUFFIX = '.prof'
+
+class ProfileMiddleware(object):
+    """Profile requests which ask for it, or a sample of all requests."""
+
+    def __init__(self, app, config):
+
+        self.app = app
+        self.directory = config.get('herder.profile.directory',
+                                    os.path.join(config['cache_dir'],
+                                                 'profiles'))
+        self.sample_rate = float(config.get('herder.profile.sample_rate', 0))
+        self.keep = int(config.get('herder.profile.keep', DEFAULT_KEEP))
+
+    def requested(self, environ):
+        """Return True if the request should be profiled."""
+
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+
+        if 'HTTP_X_HERDER_PROFILE' not in environ and \
+                '__profile' not in cgi.parse_qs(
+                    environ.get('QUERY_STRING', ''), keep_blank_values=True):
+            return False
+
+        return 'administrator' in user_roles(environ)
+
+    def __call__(self, environ, start_response):
+
+        if not self.requested(environ):
+            return self.app(environ, start_response)
+
+        profiler = Profile()
+        start = time.time()
+        try:
+            # read the whole response, so streamed output is profiled too
+            return profiler.runcall(self._call, environ, start_response)
+        finally:
+            self.save(profiler, route_name(environ), time.time() - start)
+
+    def _call(self, environ, start_response):
+
+        app_iter = self.app(environ, start_response)
+        try:
+            return list(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+    def save(self, profiler, route, elapsed):
+        """Write the profile of a request to route which took elapsed
+        seconds, and remove the oldest profiles beyond the limit."""
+
+        now = time.time()
+        filename = '%s.%06d-%d-%s-%dms%s' % (
+            time.strftime('%Y%m%d-%H%M%S', time.localtime(now)),
+            int((now % 1) * 1000000), os.getpid(), route.replace('/', '.'),
+            int(elapsed * 1000), PROFILE_SUFFIX)
+
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+
+            profiler.dump_stats(os.path.join(self.directory, filename))
+
+            if self.keep > 0:
+                # the names start with the time, so they sort oldest first
+                profiles = sorted([fn for fn in os.listdir(self.directory)
+                                   if fn.endswith(PROFILE_SUFFIX)])
+                for old in profiles[:-self.keep]:
+                    os.remove(os.path.join(self.directory, old))
+        except (IOError, OSError), e:
+            log.warning('Unable to save profile %s: %s', filename, e)
@@ -0,0 +1,158 @@
+"""Provisioning of the context roles for each domain and language.
+
+Each domain has a ``domain-<name>-<role>`` role, and each language a
+``lang-<name>-<role>`` role, for every role in ``CONTEXT_ROLES``.  The
+roles are created when the application starts; ``herder.roles.sync``
+controls how:
+
+``startup``
+    create any missing roles before the application serves requests
+    (the default)
+
+``background``
+    create them in a background thread, so workers start serving
+    immediately
+
+``lazy``
+    create the roles for a domain (and its languages) the first time
+    a request for it is handled
+"""
+import logging
+import threading
+
+import sqlalchemy as sa
+import authkit.users.sqlalchemy_04_driver
+
+from herder import model
+
+log = logging.getLogger(__name__)
+
+CONTEXT_ROLES = ('administer', 'translate', )
+SYNC_MODES = ('startup', 'background', 'lazy', )
+
+def domain_roles(domain):
+    """Return a list of the context role names for domain and each of its
+    languages."""
+
+    names = ['domain-%s-%s' % (domain.name, cr) for cr in CONTEXT_ROLES]
+
+    for lang in domain.languages:
+        names.extend(['lang-%s-%s' % (lang.name, cr) for cr in CONTEXT_ROLES])
+
+    return [n.lower() for n in names]
+
+def route_domain(routes_dict):
+    """Return the name of the domain a request is routed to, or None."""
+
+    if 'domain' in routes_dict:
+        return routes_dict['domain']
+
+    if routes_dict.get('controller') == 'domain' and \
+            routes_dict.get('action') == 'view':
+        return routes_dict.get('id')
+
+    return None
+
+class RoleSync(object):
+    """Creates the context roles which don't exist yet."""
+
+    def __init__(self, manager, mode='startup'):
+
+        if mode not in SYNC_MODES:
+            raise ValueError("Unknown role sync mode %r." % mode)
+
+        self.manager = manager
+        self.mode = mode
+
+        self._synced = set()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Sync the roles as configured by the mode."""
+
+        if self.mode == 'startup':
+            self.sync()
+
+        elif self.mode == 'background':
+            thread = threading.Thread(target=self._sync_logged,
+                                      name='herder-role-sync')
+            thread.setDaemon(True)
+            thread.start()
+
+    def sync(self, domains=None):
+        """Create the missing roles for a sequence of domains (by default
+        all of them); returns a list of the role names created.
+
+        The existing roles are read with a single query and the missing
+        ones are inserted in a single transaction.  If another process
+        creates some of them at the same time, the sync is retried."""
+
+        if domains is None:
+            domains = model.Domain.all()
+
+        required = set()
+        for domain in domains:
+            required.update(domain_roles(domain))
+
+        try:
+            created = self._create_missing(required)
+        except sa.exceptions.DBAPIError:
+            # lost a race with another worker; the roles it created will be
+            # seen by the second attempt
+            created = self._create_missing(required)
+
+        self._lock.acquire()
+        try:
+            self._synced.update([d.name for d in domains])
+        finally:
+            self._lock.release()
+
+        if created:
+            log.info("Created %d roles." % len(created))
+
+        return created
+
+    def ensure(self, domain_name):
+        """Sync the roles for the domain domain_name if it hasn't been
+        synced by this process; used by the lazy mode."""
+
+        if self.mode != 'lazy' or domain_name is None or \
+                domain_name in self._synced:
+            return
+
+        try:
+            domain = model.Domain.by_name(domain_name)
+        except KeyError:
+            return
+
+        self.sync([domain])
+
+    def _sync_logged(self):
+
+        try:
+            self.sync()
+        except Exception:
+            log.exception("Role sync failed.")
+
+    def _create_missing(self, required):
+
+        connection = self.manager.engine.connect()
+        session = self.manager.session_maker(bind=connection)
+        try:
+            environ = {}
+            environ['sqlalchemy.session'] = session
+            environ['sqlalchemy.model'] = self.manager.model
+            users = authkit.users.sqlalchemy_04_driver.UsersFromDatabase(
+                environ)
+
+            missing = sorted(required.difference(users.list_roles()))
+            for name in missing:
+                session.save(self.manager.model.Role(name))
+
+            session.flush()
+            session.commit()
+
+            return missing
+        finally:
+            session.close()
+            connection.close()
@@ -1,7 +1,8 @@
 from language import Language as DomainLanguage
 from language import Language
 from domain import Domain
-from message import Message
+from message import Message, EditConflict
+import search
 
 from pylons import config
 from sqlalchemy import Column, MetaData, Table, types
@@ -0,0 +1,136 @@
+"""In-process cache of message values.
+
+Reading a language means listing its message store and opening every
+message file; the cache keeps the result of that scan in memory,
+keyed by the store path and validated against a stamp (the directory
+mtime for the file store) so that changes made by other processes are
+picked up on the next access.
+"""
+import threading
+
+from pylons import config
+
+DEFAULT_MAX_MESSAGES = 100000
+
+class MessageCache(object):
+    """A size bounded LRU cache of message dictionaries.
+
+    The size of the cache is measured in messages rather than entries,
+    so a few very large languages can not push the process' memory use
+    past its setting (``herder.cache.max_messages`` by default).  The
+    size of an entry is len() of its values, unless the caller gives
+    another; derived data such as a status index is a dictionary of a
+    few keys, but holds something for every message."""
+
+    def __init__(self, max_messages=None, setting='herder.cache.max_messages'):
+
+        self._max_messages = max_messages
+        self._setting = setting
+        self._entries = {}
+        self._sizes = {}
+        self._order = []
+        self._size = 0
+        self._lock = threading.RLock()
+
+    @property
+    def max_messages(self):
+        """Return the maximum number of messages held by the cache."""
+
+        if self._max_messages is not None:
+            return self._max_messages
+
+        return int(config.get(self._setting, DEFAULT_MAX_MESSAGES))
+
+    def get(self, key, stamp, loader, size=len):
+        """Return the values cached for key; if no values are cached or
+        the cached stamp differs from stamp, call loader to (re)load them.
+        size is called with loaded values to find how many messages they
+        count as.
+
+        The stamp must be computed before loading, so that a change made
+        while the loader runs results in a reload on the next access."""
+
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self._order.remove(key)
+                self._order.append(key)
+
+                return entry[1]
+        finally:
+            self._lock.release()
+
+        # load outside the lock so one large language doesn't block others
+        values = loader()
+        self.put(key, stamp, values, size(values))
+
+        return values
+
+    def peek(self, key):
+        """Return the (stamp, values) cached for key, or None; unlike get,
+        this doesn't count as a use of the entry."""
+
+        self._lock.acquire()
+        try:
+            return self._entries.get(key)
+        finally:
+            self._lock.release()
+
+    def put(self, key, stamp, values, size=None):
+        """Store values for key, counting as size messages (by default
+        len(values)), evicting the least recently used entries if the
+        cache grows beyond its bound."""
+
+        if size is None:
+            size = len(values)
+
+        self._lock.acquire()
+        try:
+            self._discard(key)
+
+            if size > self.max_messages:
+                # never cache something that would evict everything else
+                return
+
+            self._entries[key] = (stamp, values)
+            self._sizes[key] = size
+            self._order.append(key)
+            self._size += size
+
+            while self._size > self.max_messages:
+                self._discard(self._order[0])
+        finally:
+            self._lock.release()
+
+    def invalidate(self, key):
+        """Drop any values cached for key."""
+
+        self._lock.acquire()
+        try:
+            self._discard(key)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """Drop all cached values."""
+
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+            self._sizes.clear()
+            self._order = []
+            self._size = 0
+        finally:
+            self._lock.release()
+
+    def _discard(self, key):
+
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._order.remove(key)
+            self._size -= self._sizes.pop(key)
+
+# the per-process caches shared by all Language instances
+messages = MessageCache()
+indexes = MessageCache()
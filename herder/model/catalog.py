@@ -0,0 +1,191 @@
+"""Import and export of gettext catalogs.
+
+Every import records, per language, a manifest of the catalogs it read:
+a digest of each ``.po`` file and the msgid and value imported for each
+message.  The manifest lets a sync skip unchanged catalogs, tell
+upstream changes apart from edits made in herder since the last
+import, and map message ids back to msgids when exporting.
+"""
+import os
+from StringIO import StringIO
+
+from babel.core import UnknownLocaleError
+from babel.messages.catalog import Catalog
+import babel.messages.pofile
+import babel.messages.mofile
+
+import counters
+import metadir
+
+MANIFEST_FILE = 'import.json'
+
+EXPORT_FORMATS = {'po': babel.messages.pofile.write_po,
+                  'mo': babel.messages.mofile.write_mo,
+                  }
+
+class ImportManifest(object):
+    """The import manifest for a language."""
+
+    def __init__(self, language):
+
+        self.language = language
+        self.path = metadir.meta_path(language._message_store, MANIFEST_FILE)
+        self.data = metadir.read_json(self.path, dict(catalogs={}))
+
+    def save(self):
+        """Persist the manifest."""
+
+        metadir.write_json(self.path, self.data)
+
+    def digest(self, name):
+        """Return the digest recorded for the catalog name, or None if it
+        has not been imported."""
+
+        catalog = self.data['catalogs'].get(name)
+        if catalog is None:
+            return None
+
+        return catalog['digest']
+
+    def msgids(self):
+        """Return a dictionary mapping message id to msgid for every
+        imported message."""
+
+        result = {}
+        for catalog in self.data['catalogs'].values():
+            for id, (msgid, value) in catalog['messages'].items():
+                result[id] = msgid
+
+        return result
+
+    def import_messages(self, name, digest, messages, sync=False):
+        """Import a sequence of (id, msgid, value) tuples read from the
+        catalog name, whose contents have the given digest, and record
+        them in the manifest.
+
+        Without sync every message is written, as a plain import always
+        has.  With sync only messages whose upstream value changed since
+        the last import are written; messages edited in herder since
+        then are kept, and reported as conflicts if upstream changed
+        them too.  Messages which differ from the catalog but have no
+        value recorded by a previous import are treated as edited.
+        Messages which have disappeared from the catalog are removed
+        unless they have been edited.
+
+        Returns a dictionary with lists of the ``added``, ``changed``,
+        ``removed`` and ``conflicts`` message ids."""
+
+        previous = self.data['catalogs'].get(name, dict(messages={}))
+        baseline = dict([(id, value) for id, (msgid, value) in
+                         previous['messages'].items()])
+        current = self.language.values()
+
+        report = dict(added=[], changed=[], removed=[], conflicts=[])
+        writes = {}
+
+        for id, msgid, value in messages:
+
+            if id not in current:
+                writes[id] = value
+                report['added'].append(id)
+
+            elif current[id] == value:
+                continue
+
+            elif not sync or current[id] == baseline.get(id):
+                # unchanged in herder since the last import
+                writes[id] = value
+                report['changed'].append(id)
+
+            elif id not in baseline:
+                # never imported from this catalog, so the stored value
+                # may be an edit made in herder; keep it
+                report['conflicts'].append(id)
+
+            elif value != baseline[id]:
+                # changed both upstream and in herder; keep the edit
+                report['conflicts'].append(id)
+
+        deletes = []
+        if sync:
+            upstream = set([id for id, msgid, value in messages])
+
+            for id in baseline:
+                if id in upstream or id not in current:
+                    continue
+
+                if current[id] == baseline[id]:
+                    deletes.append(id)
+                    report['removed'].append(id)
+                else:
+                    report['conflicts'].append(id)
+
+        if writes:
+            self.language.update_many(writes, source='import')
+        if deletes:
+            self.language.delete_many(deletes, source='import')
+
+        self.data['catalogs'][name] = dict(
+            digest=digest,
+            messages=dict([(id, (msgid, value))
+                           for id, msgid, value in messages]))
+        self.save()
+
+        return report
+
+def build_catalog(language):
+    """Return a babel Catalog containing the messages in language.
+
+    Messages are keyed by the msgid they were imported with; messages
+    which weren't imported use their message id."""
+
+    msgids = ImportManifest(language).msgids()
+    values = language.values()
+
+    try:
+        catalog = Catalog(locale=language.name, 
+                          domain=language.domain.name, fuzzy=False)
+    except (ValueError, UnknownLocaleError):
+        catalog = Catalog(domain=language.domain.name, fuzzy=False)
+
+    for id in language.ids():
+        msgid = msgids.get(id, id)
+        if isinstance(msgid, list):
+            # plural msgids are stored as JSON arrays
+            msgid = tuple(msgid)
+
+        catalog.add(msgid, values[id])
+
+    return catalog
+
+def export(language, format='po'):
+    """Return the path of a file containing language as a catalog in the
+    given format (po or mo).
+
+    The file is cached in the language's metadata directory, keyed on
+    its generation counter and stamp; it is only rebuilt after the
+    language has changed."""
+
+    key = '%s-%s' % (language.generation, language.stamp())
+    filename = 'export-%s.%s' % (key, format)
+    path = metadir.meta_path(language._message_store, filename)
+
+    if os.path.exists(path):
+        return path
+
+    buf = StringIO()
+    EXPORT_FORMATS[format](buf, build_catalog(language))
+    metadir.write_file(path, buf.getvalue())
+
+    # remove the exports of earlier generations
+    meta_dir = os.path.dirname(path)
+    counters.count('listdir')
+    for old in os.listdir(meta_dir):
+        if old.startswith('export-') and old.endswith('.' + format) \
+                and old != filename:
+            try:
+                os.remove(os.path.join(meta_dir, old))
+            except OSError:
+                pass
+
+    return path
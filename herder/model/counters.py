@@ -0,0 +1,34 @@
+"""Per-request counters of the work done by the model.
+
+The storage code counts its filesystem operations (``listdir``,
+``open``, ``read`` and ``write``) here; other layers add their own
+counters, such as database queries and template rendering time.  The
+counters are kept per thread between ``start`` and ``stop``, so the
+instrumentation middleware can attribute them to the request being
+handled; outside of a request, ``count`` does nothing.
+"""
+import threading
+
+_local = threading.local()
+
+def start():
+    """Start counting for the current thread, discarding any counts
+    which weren't collected."""
+
+    _local.counts = {}
+
+def stop():
+    """Stop counting for the current thread; returns a dictionary of the
+    counts since start."""
+
+    counts = getattr(_local, 'counts', None)
+    _local.counts = None
+
+    return counts or {}
+
+def count(name, n=1):
+    """Add n to the counter name for the current thread."""
+
+    counts = getattr(_local, 'counts', None)
+    if counts is not None:
+        counts[name] = counts.get(name, 0) + n
@@ -4,18 +4,24 @@ import babel.messages.pofile
 from pylons import config
 
 import language
+import metadir
+import registry
+import stats
 
 class Domain(object):
     """A translation domain."""
 
-    _IGNORE_DIRS = ['.svn', 'test', 'templates',]
+    _IGNORE_DIRS = ['.svn', 'test', 'templates', metadir.META_DIR,]
 
     @classmethod
     def by_name(cls, name):
         """Return a Domain instance by name."""
 
-        if os.path.exists(os.path.join(config.get('herder.po_dir'), name)):
-            return Domain(name, os.path.join(config.get('herder.po_dir'), name))
+        po_dir = config.get('herder.po_dir')
+
+        if name not in cls._IGNORE_DIRS and \
+                registry.directories.contains(po_dir, name):
+            return Domain(name, os.path.join(po_dir, name))
 
         raise KeyError("Unknown domain name.")
 
@@ -23,10 +29,11 @@ class Domain(object):
     def all(cls):
         """Return a sequence of all available domains."""
 
-        return [Domain(n, os.path.join(config.get('herder.po_dir'), n)) 
-                for n in os.listdir(config.get('herder.po_dir'))
-                if n not in cls._IGNORE_DIRS and 
-                   os.path.isdir(os.path.join(config.get('herder.po_dir'), n))]
+        po_dir = config.get('herder.po_dir')
+
+        return [Domain(n, os.path.join(po_dir, n)) 
+                for n in registry.directories.subdirs(po_dir)
+                if n not in cls._IGNORE_DIRS]
 
     def __init__(self, name, path):
         self.name = name
@@ -37,17 +44,35 @@ class Domain(object):
         """Return a sequence of available languages."""
 
         return [language.Language(self, n) 
-                for n in os.listdir(self.path)
-                if n not in self._IGNORE_DIRS and
-                   os.path.isdir(os.path.join(self.path, n))]
+                for n in registry.directories.subdirs(self.path)
+                if n not in self._IGNORE_DIRS]
+
+    @property
+    def stats(self):
+        """Return the DomainStats for this domain."""
+
+        return stats.DomainStats(self)
+
+    def version(self):
+        """Return a token which changes whenever a language is added to,
+        removed from or changed in this domain."""
+
+        return ','.join(['%s:%s' % (l.name, l.version()) 
+                         for l in self.languages])
 
     def get_language(self, lang):
         """Return a specific language for this domain."""
 
-        if os.path.exists(os.path.join(self.path, lang)) and \
-                os.path.isdir(os.path.join(self.path, lang)):
+        if lang not in self._IGNORE_DIRS and \
+                registry.directories.contains(self.path, lang):
 
             return language.Language(self, lang)
 
         raise KeyError("Unknown language.")
 
+    def get_languages(self, langs):
+        """Return a list of Language objects for a sequence of language
+        names; raises KeyError if any of them are unknown."""
+
+        return [self.get_language(lang) for lang in langs]
+
@@ -0,0 +1,36 @@
+"""Notification of writes to the message store.
+
+Derived data (indexes, counters and so on) subscribes to be told when
+messages change, rather than every writer having to know about each
+of them.
+"""
+
+_subscribers = []
+
+def subscribe(handler):
+    """Register handler to be called with every MessagesChanged event."""
+
+    if handler not in _subscribers:
+        _subscribers.append(handler)
+
+def notify(event):
+    """Pass event to each registered handler, in registration order."""
+
+    for handler in list(_subscribers):
+        handler(event)
+
+class MessagesChanged(object):
+    """One or more messages in a language have been written.
+
+    ``changes`` is a sequence of (id, old value, new value) tuples, with
+    a new value of None for messages which have been deleted, and
+    ``stamp`` is the language's stamp from before the write, which lets
+    handlers tell whether their own data was current when it happened.
+    ``source`` describes the writer, either ``edit`` or ``import``."""
+
+    def __init__(self, language, changes, stamp, source='edit'):
+
+        self.language = language
+        self.changes = changes
+        self.stamp = stamp
+        self.source = source
@@ -0,0 +1,266 @@
+"""Per-domain change journal.
+
+Every write made through the model, and every suggestion made, is
+appended to the journal of its domain as a JSON record on a line of its
+own, numbered with a sequence number which increases by one with each
+record.  Clients which remember the last sequence number they saw can
+fetch just the changes made since, rather than whole languages.
+
+The offsets of the records are indexed in memory and the index is
+extended incrementally as records are appended, so reading the changes
+since a sequence number only reads those changes (and, with a limit,
+only as many of them as are needed).
+
+Each append is flushed to disk before it returns.  The latest sequence
+number is also kept in a file of its own, so it can be read without
+reading the journal; it records the size of the journal it describes,
+and the journal is read instead if that doesn't match.
+"""
+import os
+import bisect
+import threading
+import time
+
+import jsonlib
+
+import counters
+import events
+import metadir
+
+JOURNAL_FILE = 'journal.log'
+SEQUENCE_FILE = 'journal.seq'
+
+UPDATE = 'update'
+DELETE = 'delete'
+SUGGEST = 'suggest'
+
+# records read at a time when filtering by language
+READ_BATCH = 1000
+
+class Journal(object):
+    """The change journal of a domain."""
+
+    # path -> (device, inode, bytes indexed, [sequence numbers], [offsets])
+    _offsets = {}
+    _offsets_lock = threading.Lock()
+
+    def __init__(self, domain):
+
+        self.domain = domain
+        self.path = metadir.meta_path(domain.path, JOURNAL_FILE)
+        self.sequence_path = metadir.meta_path(domain.path, SEQUENCE_FILE)
+
+    def stamp(self):
+        """Return a token which changes whenever a record is appended."""
+
+        return metadir.file_stamp(self.path)
+
+    def last_sequence(self):
+        """Return the sequence number of the latest record, or 0 if the
+        journal is empty."""
+
+        fields = metadir.read_file(self.sequence_path, '0 0').split()
+
+        # the journal may have been appended to after the sequence file
+        # was written, if the system crashed in between
+        if len(fields) != 2 or int(fields[1]) != self._size():
+            sequences, offsets = self._index()
+            return (sequences or [0])[-1]
+
+        return int(fields[0])
+
+    def _size(self):
+
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def append(self, records):
+        """Append a list of records (dictionaries), numbering them and
+        adding the time; returns the last sequence number used."""
+
+        if not records:
+            return self.last_sequence()
+
+        lock = metadir.lock(self.domain.path)
+        try:
+            sequence = self.last_sequence()
+            now = time.time()
+            lines = []
+
+            for record in records:
+                sequence += 1
+                lines.append(jsonlib.write(dict(record, seq=sequence,
+                                                time=now)) + "\n")
+
+            counters.count('open')
+            counters.count('write')
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                         metadir.FILE_MODE)
+            try:
+                os.write(fd, "".join(lines))
+                os.fsync(fd)
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+
+            metadir.write_file(self.sequence_path, 
+                               '%d %d' % (sequence, size))
+        finally:
+            metadir.unlock(lock)
+
+        return sequence
+
+    def since(self, sequence, limit=None, language=None):
+        """Return the records after sequence number sequence, oldest first
+        and at most limit of them; with language, only records for that
+        language are returned.
+
+        Returns a (records, last sequence number) pair; the sequence
+        number is that of the last record read, which can be passed to
+        a later call to continue from where this one stopped."""
+
+        sequences, offsets = self._index()
+        start = bisect.bisect_right(sequences, sequence)
+        if start == len(sequences):
+            return [], max([sequence] + sequences[-1:])
+
+        # without a filter the first limit records are all that's needed;
+        # with one, read in batches until enough records match
+        if limit and language is None:
+            batch = limit
+        else:
+            batch = READ_BATCH
+
+        records = []
+        last = sequence
+
+        counters.count('open')
+        journal = file(self.path, 'rb')
+        try:
+            journal.seek(offsets[start])
+
+            while start < len(sequences):
+                end = min(start + batch, len(sequences))
+
+                counters.count('read')
+                data = journal.read(offsets[end] - offsets[start])
+                start = end
+
+                for line in data.split("\n")[:-1]:
+                    record = jsonlib.read(line, use_float=True)
+                    last = record['seq']
+
+                    if language is not None and \
+                            record.get('language') != language:
+                        continue
+
+                    records.append(record)
+                    if limit and len(records) == limit:
+                        return records, last
+        finally:
+            journal.close()
+
+        return records, last
+
+    def wait(self, sequence, timeout, interval=0.5):
+        """Wait up to timeout seconds for a record after sequence number
+        sequence to be appended; returns True if one was."""
+
+        deadline = time.time() + timeout
+
+        while self.last_sequence() <= sequence:
+            if time.time() >= deadline:
+                return False
+
+            time.sleep(min(interval, max(deadline - time.time(), 0)))
+
+        return True
+
+    def _index(self):
+        """Return the lists of sequence numbers and offsets of the complete
+        records in the journal; the offsets list has an extra entry, the
+        end of the last record."""
+
+        counters.count('open')
+        try:
+            journal = file(self.path, 'rb')
+        except IOError:
+            return [], [0]
+
+        try:
+            st = os.fstat(journal.fileno())
+
+            self._offsets_lock.acquire()
+            try:
+                cached = self._offsets.get(self.path)
+            finally:
+                self._offsets_lock.release()
+
+            if cached is not None and cached[:2] == (st.st_dev, st.st_ino) \
+                    and cached[2] <= st.st_size:
+                if cached[2] == st.st_size:
+                    return cached[3], cached[4]
+
+                start = cached[2]
+                sequences, offsets = list(cached[3]), list(cached[4])
+            else:
+                start, sequences, offsets = 0, [], [0]
+
+            counters.count('read')
+            journal.seek(start)
+            data = journal.read(st.st_size - start)
+        finally:
+            journal.close()
+
+        pos = 0
+        while True:
+            end = data.find("\n", pos)
+            if end == -1:
+                # a partially written record
+                break
+
+            sequences.append(jsonlib.read(data[pos:end])['seq'])
+            offsets.append(start + end + 1)
+            pos = end + 1
+
+        self._offsets_lock.acquire()
+        try:
+            self._offsets[self.path] = (st.st_dev, st.st_ino, start + pos,
+                                        sequences, offsets)
+        finally:
+            self._offsets_lock.release()
+
+        return sequences, offsets
+
+def record_changes(event):
+    """Journal the changes made by a write to a language.
+
+    Updates made by an import don't include the new value: an import
+    writes whole catalogs, and the journal is never truncated, so
+    copying every value into it would grow it by the size of the
+    catalogs on every import.  Clients read those values from the
+    language."""
+
+    records = []
+    for id, old_value, new_value in event.changes:
+        if new_value is None:
+            records.append(dict(type=DELETE, language=event.language.name,
+                                id=id, source=event.source))
+        elif event.source == 'import':
+            records.append(dict(type=UPDATE, language=event.language.name,
+                                id=id, source=event.source))
+        else:
+            records.append(dict(type=UPDATE, language=event.language.name,
+                                id=id, value=new_value, source=event.source))
+
+    Journal(event.language.domain).append(records)
+
+events.subscribe(record_changes)
+
+def record_suggestion(language, id, user, value):
+    """Journal a suggestion made for a message."""
+
+    Journal(language.domain).append([dict(type=SUGGEST, 
+        language=language.name, id=id, user=user, value=value)])
@@ -1,10 +1,22 @@
 import os
+import bisect
 import babel.messages.pofile
 
 from pylons import config
 
 import domain
 import message
+import cache
+import events
+import journal
+import metadir
+import status
+import stats
+import storage
+import suggestions
+
+GENERATION_FILE = 'generation'
+VERSIONS_FILE = 'versions.json'
 
 class Language(object):
     """A specific language within a domain."""
@@ -17,6 +29,7 @@ class Language(object):
     def __init__(self, domain, lang):
         self.domain = domain
         self.lang = lang
+        self._store = None
 
     def __str__(self):
         return self.lang
@@ -36,6 +49,346 @@ class Language(object):
 
         return os.path.join(self.domain.path, self.lang)
 
+    @property
+    def store(self):
+        """Return the storage backend holding this language's messages."""
+
+        if self._store is None:
+            self._store = storage.get_store(self._message_store)
+
+        return self._store
+
+    def stamp(self):
+        """Return a token which changes whenever a message is added to,
+        removed from or updated in this language."""
+
+        return self.store.stamp()
+
+    def version(self):
+        """Return a cheap token identifying the current contents of this
+        language, suitable for use as an HTTP entity tag; it is computed
+        without reading any messages."""
+
+        return '%s-%s' % (self.generation, self.stamp())
+
+    def touch(self):
+        """Mark the message store as modified."""
+
+        # the store may have been converted to another format
+        self._store = None
+
+        self.store.touch()
+        self._invalidate()
+
+    @property
+    def generation(self):
+        """Return the generation counter of this language, which is
+        incremented by every write made through the model."""
+
+        return int(metadir.read_file(
+                metadir.meta_path(self._message_store, GENERATION_FILE), '0'))
+
+    def _bump_generation(self):
+
+        metadir.write_file(
+            metadir.meta_path(self._message_store, GENERATION_FILE),
+            str(self.generation + 1))
+
+    def _invalidate(self):
+        """Drop anything cached for this language in this process."""
+
+        cache.messages.invalidate(self._message_store)
+        cache.indexes.invalidate(self._message_store)
+
+    def _load(self):
+        """Read every message in the store; returns a dictionary mapping
+        message ids to values."""
+
+        return self.store.load()
+
+    def values(self):
+        """Return a dictionary mapping message ids to their current value.
+
+        The dictionary is shared with the message cache and must not be
+        modified."""
+
+        return cache.messages.get(self._message_store, self.stamp(), 
+                                  self._load)
+
+    def read(self, id):
+        """Return the value of the message id, or None if it does not
+        exist.
+
+        If the language is cached the value comes from the cache;
+        otherwise only the one message is read from the store (for a
+        packed store, through its offset index), rather than loading
+        every message."""
+
+        entry = cache.messages.peek(self._message_store)
+        if entry is not None and entry[0] == self.stamp():
+            return entry[1].get(id)
+
+        return self.store.read(id)
+
+    def ids(self):
+        """Return a sorted list of the message ids in this language.
+
+        Like values(), the list is shared with the cache and must not be
+        modified."""
+
+        stamp = self.stamp()
+        values = cache.messages.get(self._message_store, stamp, self._load)
+
+        return cache.indexes.get(self._message_store, stamp,
+                                 lambda: sorted(values))
+
+    def select(self, prefix=None, after=None, reverse=False):
+        """Yield message ids in sorted order, optionally limited to ids
+        starting with prefix and resuming after the id after; if reverse
+        is True, ids are returned in descending order.
+
+        The range is located in the sorted id index by bisection, so
+        resuming late in a large language doesn't require a scan."""
+
+        ids = self.ids()
+        lo, hi = 0, len(ids)
+
+        if prefix:
+            prefix = prefix.lower()
+            lo = bisect.bisect_left(ids, prefix)
+            hi = _bisect_prefix_end(ids, prefix, lo)
+
+        if after is not None:
+            if reverse:
+                hi = min(hi, bisect.bisect_left(ids, after))
+            else:
+                lo = max(lo, bisect.bisect_right(ids, after))
+
+        if reverse:
+            indexes = xrange(hi - 1, lo - 1, -1)
+        else:
+            indexes = xrange(lo, hi)
+
+        for i in indexes:
+            yield ids[i]
+
+    def join(self, others, ids=None):
+        """Join the messages in this language with those in a sequence of
+        other languages; yields (id, value, {language name: value})
+        tuples for each message in this language, or for each id in ids
+        if provided.
+
+        Each language is read with a single scan of its store and the
+        results are joined on message id, so the cost grows with the
+        number of languages rather than the number of lookups."""
+
+        tables = [(self.name, self.values())] + \
+            [(other.name, other.values()) for other in others]
+
+        if ids is None:
+            ids = tables[0][1].iterkeys()
+
+        for id in ids:
+            value = tables[0][1].get(id, "")
+            yield (id, value, 
+                   dict([(name, values.get(id, "")) for name, values in tables])
+                   )
+
+    @property
+    def status(self):
+        """Return the StatusIndex for this language."""
+
+        return status.StatusIndex(self)
+
+    @property
+    def stats(self):
+        """Return the counters and last modified time of this language."""
+
+        return stats.DomainStats(self.domain).languages()[self.name]
+
+    @property
+    def suggestions(self):
+        """Return the SuggestionLog for this language."""
+
+        return suggestions.SuggestionLog(self)
+
+    def suggest(self, username, id, suggestion):
+        """Store a suggestion for a message; see Message.suggest."""
+
+        return self.get_message(id).suggest(username, suggestion)
+
+    def update(self, id, new_value, old_value=None, version=None):
+        """Update a single message; see Message.update."""
+
+        self.get_message(id).update(new_value, old_value, version)
+
+    def versions(self):
+        """Return a dictionary mapping message id to the version number of
+        every message which has been written through the model.
+
+        The versions file records the stamp of the store it was written
+        with; if the store has changed since, as it may have if the
+        system crashed after writing messages, the versions are brought
+        up to date from the journal."""
+
+        path = metadir.meta_path(self._message_store, VERSIONS_FILE)
+        stamp = self.stamp()
+
+        def load():
+            data = metadir.read_json(path, {})
+            if 'stamp' not in data or not isinstance(data.get('versions'), 
+                                                     dict):
+                # written before stamps were recorded
+                return data
+
+            if data['stamp'] == stamp:
+                return data['versions']
+
+            return self._replay_versions(data['versions'])
+
+        return cache.indexes.get(path, '%s %s' % (metadir.file_stamp(path),
+                                                  stamp), load)
+
+    def _replay_versions(self, versions):
+        """Return versions updated with the changes to this language in
+        the journal.  A version is never decreased, so an edit can't be
+        accepted against a version the message has already had."""
+
+        counts = {}
+        records, last = journal.Journal(self.domain).since(
+            0, language=self.name)
+
+        for record in records:
+            if record['type'] == journal.UPDATE:
+                counts[record['id']] = (counts.get(record['id']) or 0) + 1
+            elif record['type'] == journal.DELETE:
+                counts[record['id']] = None
+
+        versions = dict(versions)
+        for id, count in counts.items():
+            if count is None:
+                versions.pop(id, None)
+            else:
+                versions[id] = max(versions.get(id, 0), count)
+
+        return versions
+
+    def update_many(self, values, source='edit', expected=None):
+        """Write a dictionary of message id -> value to the store and
+        notify subscribers of the change.
+
+        If expected is provided it maps message ids to the version each
+        edit was based on; if any of those messages is at a different
+        version nothing is written and EditConflict is raised.  The check
+        and the write are made under the language's lock, so concurrent
+        edits from any process can't overwrite each other."""
+
+        lock = metadir.lock(self._message_store)
+        try:
+            if expected:
+                versions = self.versions()
+                conflicts = [id for id, version in expected.items()
+                             if versions.get(message.Message(self, id).id, 0)
+                                != version]
+                if conflicts:
+                    raise message.EditConflict(conflicts)
+
+            self._write(values, source)
+        finally:
+            metadir.unlock(lock)
+
+    def edit_many(self, edits, source='edit'):
+        """Apply a sequence of (id, new_value, old_value, version) edits
+        and return a list of the ids of the edits which conflicted.
+
+        Each edit is checked like Message.update: against version if it
+        isn't None, otherwise against old_value if that isn't None.  The
+        edits which don't conflict are written together, with a single
+        store write and a single change notification."""
+
+        lock = metadir.lock(self._message_store)
+        try:
+            current = self.values()
+            versions = self.versions()
+            values = {}
+            conflicts = []
+
+            for id, new_value, old_value, version in edits:
+                id = message.Message(self, id).id
+
+                if version is not None:
+                    ok = versions.get(id, 0) == version
+                elif old_value is not None:
+                    ok = current.get(id, "") == old_value
+                else:
+                    ok = True
+
+                if ok:
+                    values[id] = new_value
+                else:
+                    conflicts.append(id)
+
+            if values:
+                self._write(values, source)
+
+            return conflicts
+        finally:
+            metadir.unlock(lock)
+
+    def _write(self, values, source):
+        """Write values and notify subscribers; the caller must hold the
+        language's lock."""
+
+        stamp = self.stamp()
+        current = self.values()
+        versions = dict(self.versions())
+        changes = []
+
+        for id, value in values.items():
+            id = message.Message(self, id).id
+            changes.append((id, current.get(id, ""), value))
+            versions[id] = versions.get(id, 0) + 1
+
+        self.store.write_many(dict([(id, value) 
+                                    for id, old_value, value in changes]))
+        self._write_versions(versions)
+        self._bump_generation()
+        self._invalidate()
+
+        events.notify(events.MessagesChanged(self, changes, stamp, source))
+
+    def delete_many(self, ids, source='edit'):
+        """Remove the messages in the sequence ids and notify subscribers;
+        the change for a deleted message has a new value of None."""
+
+        lock = metadir.lock(self._message_store)
+        try:
+            stamp = self.stamp()
+            current = self.values()
+            versions = dict(self.versions())
+
+            changes = [(id, current[id], None) for id in 
+                       [message.Message(self, id).id for id in ids] 
+                       if id in current]
+
+            for id, old_value, value in changes:
+                versions.pop(id, None)
+
+            self.store.delete_many([id for id, old_value, value in changes])
+            self._write_versions(versions)
+            self._bump_generation()
+            self._invalidate()
+
+            events.notify(events.MessagesChanged(self, changes, stamp, source))
+        finally:
+            metadir.unlock(lock)
+
+    def _write_versions(self, versions):
+
+        metadir.write_json(
+            metadir.meta_path(self._message_store, VERSIONS_FILE), 
+            dict(stamp=self.stamp(), versions=versions))
+
     def get_message(self, id):
         """Return a Message in this language."""
 
@@ -44,27 +397,40 @@ class Language(object):
     def messages(self):
         """Return a sequence of Message objects."""
 
-        return [Message(self, m[:-4])
-                for m in os.listdir(self._message_store)
-                if m[-4:] == '.txt']
+        return list(self)
 
     def __getitem__(self, key):
         """Convenience method for accessing a Message by id."""
 
-        if os.path.exists(os.path.join(self._message_store, '%s.txt' % key)):
-            return message.Message(self, key)
+        msg = message.Message(self, key)
+        value = self.read(msg.id)
+        if value is not None:
+            return message.Message(self, msg.id, value)
 
-        raise KeyError
+        raise KeyError(key)
 
     def __len__(self):
         
-        return len(os.listdir(self._message_store))
+        return len(self.values())
 
     def __iter__(self):
 
-        for filename in os.listdir(self._message_store):
+        for id, value in self.values().iteritems():
+
+            yield message.Message(self, id, value)
+
+def _bisect_prefix_end(ids, prefix, lo=0):
+    """Return the index after the last id in the sorted list ids which
+    starts with prefix."""
+
+    hi = len(ids)
+    size = len(prefix)
 
-            if filename[-4:] != '.txt':
-                continue
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if ids[mid][:size] <= prefix:
+            lo = mid + 1
+        else:
+            hi = mid
 
-            yield (message.Message(self, filename[:-4]))
+    return lo
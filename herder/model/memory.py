@@ -0,0 +1,220 @@
+"""Translation memory.
+
+For a message which hasn't been translated, the memory finds messages
+in any domain whose source (``en``) string is similar and which have
+been translated into the same language.  Similarity is the Jaccard
+similarity of the character trigrams of the two source strings;
+candidates are found through locality sensitive hashing of minhash
+signatures, so a lookup only compares against the few source strings
+likely to be similar.
+
+The memory for a language is built in memory on its first lookup and
+rebuilt when any of the languages it was built from changes; lookups
+are cached per source string hash, so repeated views of the same
+untranslated messages don't repeat the search.
+"""
+import random
+import threading
+
+from pylons import config
+
+import cache
+import domain
+import status
+
+DEFAULT_MATCHES = 5
+
+# matches scoring less than this are not returned
+MIN_SCORE = 0.3
+
+# minhash signatures are split into BANDS bands of ROWS hashes each; two
+# strings become candidates if any band is identical
+BANDS = 16
+ROWS = 2
+
+# each minhash uses its own hash function (a * h + b) mod PRIME from a
+# universal family; a hash XOR-ed with a seed would keep the order of the
+# high bits, so every minhash would pick the same shingle
+PRIME = (1 << 61) - 1
+SEEDS = [(random.Random(n).randrange(1, PRIME),
+          random.Random(-n - 1).randrange(0, PRIME))
+         for n in range(BANDS * ROWS)]
+
+def shingles(text):
+    """Return the set of character trigrams of text, after normalizing
+    case and whitespace."""
+
+    text = u" ".join(text.lower().split())
+    if len(text) < 3:
+        return set([text])
+
+    return set([text[i:i + 3] for i in range(len(text) - 2)])
+
+def signature(shingle_set):
+    """Return the minhash signature of a set of shingles."""
+
+    hashes = [hash(s) % PRIME for s in shingle_set]
+    return [min([(a * h + b) % PRIME for h in hashes]) for a, b in SEEDS]
+
+def bands(sig):
+    """Return the LSH band keys of a minhash signature."""
+
+    return [(n, tuple(sig[n * ROWS:(n + 1) * ROWS])) for n in range(BANDS)]
+
+class TranslationMemory(object):
+    """The translated messages of one language, across every domain."""
+
+    def __init__(self, entries):
+        """entries is a sequence of (domain name, message id, source
+        string, translation) tuples."""
+
+        self.entries = []
+        self.buckets = {}
+        self._results = {}
+        self._lock = threading.Lock()
+
+        for entry in entries:
+            if not entry[2].strip():
+                continue
+
+            shingle_set = shingles(entry[2])
+            index = len(self.entries)
+            self.entries.append((entry, shingle_set))
+
+            for band in bands(signature(shingle_set)):
+                self.buckets.setdefault(band, []).append(index)
+
+    def __len__(self):
+
+        return len(self.entries)
+
+    def lookup(self, source, k=DEFAULT_MATCHES, exclude=None):
+        """Return up to k matches for the source string source, best
+        first; each match is a dictionary with the keys domain, id,
+        source, translation and score.  exclude is a (domain name,
+        message id) pair which is never returned."""
+
+        key = status.source_hash(source)
+
+        self._lock.acquire()
+        try:
+            scored = self._results.get(key)
+        finally:
+            self._lock.release()
+
+        if scored is None:
+            scored = self._score(source)
+
+            self._lock.acquire()
+            try:
+                self._results[key] = scored
+            finally:
+                self._lock.release()
+
+        matches = []
+        for score, index in scored:
+            (domain_name, id, entry_source, translation) = \
+                self.entries[index][0]
+
+            if (domain_name, id) == exclude:
+                continue
+
+            matches.append(dict(domain=domain_name, id=id, 
+                                source=entry_source, translation=translation,
+                                score=round(score, 3)))
+            if len(matches) == k:
+                break
+
+        return matches
+
+    def _score(self, source):
+        """Return a list of (score, entry index) pairs for the entries
+        similar to source, best first."""
+
+        if not source.strip():
+            return []
+
+        shingle_set = shingles(source)
+
+        candidates = set()
+        for band in bands(signature(shingle_set)):
+            candidates.update(self.buckets.get(band, ()))
+
+        scored = []
+        for index in candidates:
+            other = self.entries[index][1]
+            score = len(shingle_set & other) / float(len(shingle_set | other))
+
+            if score >= MIN_SCORE:
+                scored.append((score, index))
+
+        scored.sort(key=lambda s: (-s[0], s[1]))
+
+        return scored
+
+# the translation memories, one per language name
+memories = cache.MessageCache(setting='herder.memory.max_messages')
+
+def _sources():
+    """Return a list of (domain, source language) pairs for every domain
+    with a source language."""
+
+    result = []
+    for d in domain.Domain.all():
+        try:
+            result.append((d, d.get_language(status.SOURCE_LANGUAGE)))
+        except KeyError:
+            pass
+
+    return result
+
+def _load(lang, sources):
+
+    entries = []
+
+    for d, source in sources:
+        try:
+            language = d.get_language(lang)
+        except KeyError:
+            continue
+
+        source_values = source.values()
+        values = language.values()
+
+        for id, (message_status, source_hash) in \
+                language.status.messages().iteritems():
+            if message_status == status.TRANSLATED and id in source_values:
+                entries.append((d.name, id, source_values[id], values[id]))
+
+    return TranslationMemory(entries)
+
+def for_language(lang):
+    """Return the TranslationMemory for the language name lang."""
+
+    sources = _sources()
+
+    stamps = []
+    for d, source in sources:
+        try:
+            stamps.append((d.name, source.stamp(), 
+                           d.get_language(lang).stamp()))
+        except KeyError:
+            pass
+
+    return memories.get(lang, tuple(stamps), lambda: _load(lang, sources))
+
+def matches(language, ids, k=DEFAULT_MATCHES):
+    """Return a dictionary mapping each message id in the sequence ids to
+    a list of up to k translation memory matches for it in language."""
+
+    try:
+        source_values = language.domain.get_language(
+            status.SOURCE_LANGUAGE).values()
+    except KeyError:
+        return dict([(id, []) for id in ids])
+
+    memory = for_language(language.name)
+
+    return dict([(id, memory.lookup(source_values.get(id, ""), k, 
+                                    (language.domain.name, id)))
+                 for id in ids])
@@ -7,6 +7,15 @@ from pylons import config
 import domain
 import language
 
+class EditConflict(Exception):
+    """Raised when a message has been changed since the version an edit
+    was based on; ids is the list of conflicting message ids."""
+
+    def __init__(self, ids):
+
+        Exception.__init__(self, "Edit conflict: %s" % ", ".join(ids))
+        self.ids = ids
+
 class Message(object):
     """A specific string in a particular language."""
 
@@ -19,10 +28,11 @@ class Message(object):
         return Message(language.Language.by_domain_id(domain_id, language_id),
                        message_id)
 
-    def __init__(self, language, id):
+    def __init__(self, language, id, value=None):
         
         self.language = language
         self.id = self.normalize_id(id)
+        self._value = value
 
     def normalize_id(self, id):
         """Return the normalized version of the string ID."""
@@ -42,35 +52,54 @@ class Message(object):
     def datafile_path(self):
         """Return the file path used to store this message."""
 
-        return os.path.join(self.language.domain.path, self.language.name,
-                            self.id + '.txt')
+        return self.language.store.datafile_path(self.id)
 
     @property
     def string(self):
         """Return the current value of the string."""
     
-        if not os.path.exists(self.datafile_path):
-            return ""
+        if self._value is None:
+            self._value = self.language.read(self.id) or ""
+
+        return self._value
+
+    @property
+    def version(self):
+        """Return the version number of the message, which is incremented
+        every time it is written; 0 if it has never been written through
+        the model."""
+
+        return self.language.versions().get(self.id, 0)
+
+    def update(self, new_value, old_value=None, version=None):
+        """Update a string; if version is provided, only perform the edit
+        if the message is still at that version.  If only old_value is
+        provided, the edit is performed if the current value is still
+        old_value.  Raises EditConflict if the message has been editted in
+        the interim."""
 
-        return codecs.open(self.datafile_path, 'r', 'utf-8').read()
+        if version is None and old_value is not None:
+            # read the version first; if the message changes after the
+            # value is compared, the version check below fails
+            version = self.version
 
-    def update(self, new_value, old_value=None):
-        """Update a string; if old_value is provided, only perform the edit
-        if the value has not been editted in the interim."""
+            if self.language.values().get(self.id, "") != old_value:
+                raise EditConflict([self.id])
 
-        if old_value is not None:
-            if self.value != old_value:
-                raise Exception
+        expected = None
+        if version is not None:
+            expected = {self.id: version}
 
-        file(self.datafile_path, 'w').write(new_value)
+        self.language.update_many({self.id: new_value}, expected=expected)
+        self._value = None
 
-    def suggest(self, username, string_id, suggestion):
-        """Store a suggestion for a given string."""
+    def suggest(self, username, suggestion):
+        """Store a suggestion for this message; returns its id."""
 
-        # figure out where to store this suggestion
-        sugg_path = os.path.join(self.domain.path, self.lang, 'suggestions',
-                                 hash(string_id))
-        if not os.path.exists(sugg_path):
-            os.mkdirs(sugg_path)
+        return self.language.suggestions.add(username, self.id, suggestion)
+
+    @property
+    def suggestions(self):
+        """Return the list of pending suggestions for this message."""
 
-        # write the suggestion to disk
+        return self.language.suggestions.for_message(self.id)
@@ -0,0 +1,154 @@
+"""Helpers for the metadata herder keeps alongside the message store.
+
+Derived data such as indexes and counters is stored in a ``.herder``
+directory inside the language (or domain) directory it describes, so
+that it is shared by every process serving the same ``po_dir``.
+
+Only message data, the change journal and rewritten suggestion logs
+are flushed to disk when they are written; together they record every
+change.  Derived files are validated against the data they describe
+when they are read, and rebuilt if they are out of date, as they may be
+after a crash.
+"""
+import os
+import stat
+import fcntl
+import tempfile
+
+import jsonlib
+
+import counters
+
+META_DIR = '.herder'
+
+# mkstemp creates files readable only by their owner; the importer and
+# the web server may run as different users
+FILE_MODE = stat.S_IRUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IROTH
+
+LOCK_FILE = 'lock'
+
+def meta_path(path, filename):
+    """Return the path of the metadata file filename for the store at
+    path, creating the metadata directory if needed."""
+
+    meta_dir = os.path.join(path, META_DIR)
+    if not os.path.isdir(meta_dir):
+        try:
+            os.makedirs(meta_dir)
+        except OSError:
+            # another process may have created it in the meantime
+            if not os.path.isdir(meta_dir):
+                raise
+
+    return os.path.join(meta_dir, filename)
+
+def file_stamp(path):
+    """Return a token which changes whenever the file at path is
+    replaced or modified, or None if it doesn't exist."""
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    return '%.6f-%d-%d' % (st.st_mtime, st.st_ino, st.st_size)
+
+def lock(path):
+    """Acquire the exclusive lock for the store at path, blocking until
+    it is available; returns a token to pass to unlock.
+
+    The lock is an flock on a file in the metadata directory, so it is
+    held against other threads as well as other processes."""
+
+    fd = os.open(meta_path(path, LOCK_FILE), os.O_RDWR | os.O_CREAT, FILE_MODE)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+    except:
+        os.close(fd)
+        raise
+
+    return fd
+
+def unlock(token):
+    """Release a lock acquired by lock."""
+
+    try:
+        fcntl.flock(token, fcntl.LOCK_UN)
+    finally:
+        os.close(token)
+
+def read_json(path, default=None):
+    """Return the decoded contents of the JSON file at path, or default
+    if it does not exist or can not be read."""
+
+    if not os.path.exists(path):
+        return default
+
+    counters.count('open')
+    counters.count('read')
+    try:
+        f = file(path, 'rb')
+        try:
+            return jsonlib.read(f.read(), use_float=True)
+        finally:
+            f.close()
+    except (IOError, jsonlib.ReadError):
+        return default
+
+def read_file(path, default=None):
+    """Return the contents of the file at path, or default if it does
+    not exist."""
+
+    counters.count('open')
+    try:
+        f = file(path, 'rb')
+    except IOError:
+        return default
+
+    counters.count('read')
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+def write_json(path, data):
+    """Atomically replace the file at path with the JSON encoding of
+    data."""
+
+    write_file(path, jsonlib.write(data))
+
+def write_file(path, contents, sync=False):
+    """Atomically replace the file at path with contents; readers see
+    either the old or the new contents, never a partial write.
+
+    With sync the new contents are flushed to disk before the file is
+    renamed into place, so a crash can't leave an empty or truncated
+    file behind; the rename itself is durable once the directory has
+    been synced (see sync_dir).  Files which can be rebuilt don't need
+    to be synced."""
+
+    counters.count('open')
+    counters.count('write')
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                     prefix='.tmp-')
+    f = os.fdopen(fd, 'wb')
+    try:
+        f.write(contents)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        f.close()
+
+    os.chmod(temp_path, FILE_MODE)
+    os.rename(temp_path, path)
+
+def sync_dir(path):
+    """Flush the directory at path to disk, making the files renamed
+    into it durable."""
+
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
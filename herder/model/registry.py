@@ -0,0 +1,106 @@
+"""In-process registry of the domain and language directories.
+
+Every request looks up its domain and language by name; rather than
+listing ``herder.po_dir`` (and stat-ing each entry) on every lookup, the
+subdirectories of each directory are listed once and shared by all
+callers.  A listing is revalidated against the directory mtime at most
+once every ``herder.registry.check_interval`` seconds, and a lookup for
+a name which isn't listed always revalidates, so new domains and
+languages are visible immediately; ``reload`` drops every listing.
+"""
+import os
+import time
+import threading
+
+from pylons import config
+
+import counters
+
+DEFAULT_CHECK_INTERVAL = 2.0
+
+class DirectoryRegistry(object):
+    """A cache of the subdirectories of a set of directories."""
+
+    def __init__(self, check_interval=None):
+
+        self._check_interval = check_interval
+        # path -> (mtime, checked at, [names], set(names))
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @property
+    def check_interval(self):
+        """Return the number of seconds a listing is used without checking
+        the directory mtime."""
+
+        if self._check_interval is not None:
+            return self._check_interval
+
+        return float(config.get('herder.registry.check_interval',
+                                DEFAULT_CHECK_INTERVAL))
+
+    def subdirs(self, path, force=False):
+        """Return a sorted list of the names of the subdirectories of path;
+        with force, the directory mtime is checked regardless of when it
+        was last checked."""
+
+        return self._entry(path, force)[2]
+
+    def contains(self, path, name):
+        """Return True if name is a subdirectory of path."""
+
+        if name in self._entry(path)[3]:
+            return True
+
+        # it may have been created since the listing was made
+        return name in self._entry(path, force=True)[3]
+
+    def reload(self):
+        """Drop every listing, so that each directory is listed again on
+        its next lookup."""
+
+        self._lock.acquire()
+        try:
+            self._entries.clear()
+        finally:
+            self._lock.release()
+
+    def _entry(self, path, force=False):
+
+        now = time.time()
+
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(path)
+        finally:
+            self._lock.release()
+
+        if entry is not None and not force and \
+                now - entry[1] < self.check_interval:
+            return entry
+
+        mtime = os.stat(path).st_mtime
+        if entry is not None and entry[0] == mtime:
+            entry = (mtime, now, entry[2], entry[3])
+        else:
+            counters.count('listdir')
+            names = [n for n in os.listdir(path)
+                     if os.path.isdir(os.path.join(path, n))]
+            names.sort()
+            entry = (mtime, now, names, set(names))
+
+        self._lock.acquire()
+        try:
+            self._entries[path] = entry
+        finally:
+            self._lock.release()
+
+        return entry
+
+# the per-process registry shared by all Domain instances
+directories = DirectoryRegistry()
+
+def reload():
+    """Drop the cached domain and language listings."""
+
+    directories.reload()
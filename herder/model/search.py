@@ -0,0 +1,245 @@
+"""Full-text search over message ids and values.
+
+Each language gets an inverted index mapping the words in its messages,
+and the trigrams of those words, to message ids.  A query matches the
+messages which contain every one of its words, either as a whole word
+or as part of one: words of three or more characters are looked up by
+their trigrams and the candidates checked against the message text, so
+no language is ever scanned.
+
+The indexes are built in memory when a language is first searched and
+are validated against its stamp; writes made through the model in this
+process update them incrementally, while changes made elsewhere (by the
+importer, for example) cause the language to be reindexed on the next
+search.
+
+The indexes are not persisted and are kept per process, in a cache
+bounded by ``herder.search.max_messages``.  A search walks every
+language it covers, so if those languages held more messages than the
+cache, every query would rebuild indexes evicted by the previous one;
+such a search raises SearchTooLarge instead.  Searching more messages
+than that needs the domain or language filters, or a larger setting
+(and the memory to go with it).
+"""
+import re
+import threading
+
+from pylons import config
+
+import cache
+import domain
+import events
+import metadir
+
+DEFAULT_LIMIT = 100
+
+class SearchTooLarge(Exception):
+    """Raised when the languages to search hold more messages than the
+    index cache can keep."""
+
+    def __init__(self, messages, max_messages):
+
+        Exception.__init__(self, 
+            "Searching %d messages, but at most %d can be indexed "
+            "(herder.search.max_messages)" % (messages, max_messages))
+        self.messages = messages
+        self.max_messages = max_messages
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+def words(text):
+    """Return the list of lower case words in text."""
+
+    return WORD_RE.findall(text.lower())
+
+def trigrams(word):
+    """Return the set of trigrams in word."""
+
+    return set([word[i:i + 3] for i in range(len(word) - 2)])
+
+class LanguageIndex(object):
+    """The token and trigram index of a single language."""
+
+    def __init__(self, values):
+
+        self.tokens = {}
+        self.trigrams = {}
+        self.texts = {}
+        self._lock = threading.Lock()
+
+        for id, value in values.iteritems():
+            self._add(id, value)
+
+    def __len__(self):
+
+        return len(self.texts)
+
+    def update(self, changes):
+        """Apply a list of (id, old value, new value) changes; a new value
+        of None removes the message."""
+
+        self._lock.acquire()
+        try:
+            for id, old_value, new_value in changes:
+                self._remove(id)
+                if new_value is not None:
+                    self._add(id, new_value)
+        finally:
+            self._lock.release()
+
+    def search(self, query):
+        """Return a sorted list of the ids of the messages containing every
+        word in query."""
+
+        terms = words(query)
+        if not terms:
+            return []
+
+        self._lock.acquire()
+        try:
+            result = None
+
+            for term in terms:
+                if len(term) < 3:
+                    matches = self.tokens.get(term, set())
+                else:
+                    matches = self._substring_matches(term, result)
+
+                if result is None:
+                    result = set(matches)
+                else:
+                    result.intersection_update(matches)
+
+                if not result:
+                    return []
+        finally:
+            self._lock.release()
+
+        return sorted(result)
+
+    def _substring_matches(self, term, candidates):
+
+        postings = [self.trigrams.get(t, set()) for t in trigrams(term)]
+        postings.sort(key=len)
+
+        if candidates is None:
+            candidates = set(postings[0])
+        else:
+            candidates = candidates.intersection(postings[0])
+
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+
+        # trigrams may match across different words
+        return [id for id in candidates if term in self.texts[id]]
+
+    def _add(self, id, value):
+
+        text = u" ".join(words(id) + words(value))
+        self.texts[id] = text
+
+        for word in set(text.split()):
+            self.tokens.setdefault(word, set()).add(id)
+
+            for trigram in trigrams(word):
+                self.trigrams.setdefault(trigram, set()).add(id)
+
+    def _remove(self, id):
+
+        text = self.texts.pop(id, None)
+        if text is None:
+            return
+
+        for word in set(text.split()):
+            _discard(self.tokens, word, id)
+
+            for trigram in trigrams(word):
+                _discard(self.trigrams, trigram, id)
+
+def _discard(index, key, id):
+
+    ids = index.get(key)
+    if ids is not None:
+        ids.discard(id)
+        if not ids:
+            del index[key]
+
+# the search indexes are kept apart from the message caches, since they
+# are much larger and only needed by searches
+indexes = cache.MessageCache(setting='herder.search.max_messages')
+
+def _index_key(language):
+
+    # creates the metadata directory, so the language's stamp isn't
+    # changed by its creation on the first write
+    return metadir.meta_path(language._message_store, 'search')
+
+def language_index(language):
+    """Return the current LanguageIndex for language."""
+
+    return indexes.get(_index_key(language), language.stamp(),
+                             lambda: LanguageIndex(language.values()))
+
+def search(query, domains=None, languages=None, limit=None):
+    """Search every language, or those in the sequences of domain names
+    domains and language names languages; returns a list of (domain
+    name, language name, message id, value) tuples, at most limit
+    (``herder.search.limit``) long.
+
+    Raises SearchTooLarge if the languages hold more messages than the
+    index cache can keep."""
+
+    if limit is None:
+        limit = int(config.get('herder.search.limit', DEFAULT_LIMIT))
+
+    # find the languages to search, and count their messages from the
+    # domain statistics
+    searched = []
+    messages = 0
+
+    for d in domain.Domain.all():
+        if domains and d.name not in domains:
+            continue
+
+        counts = d.stats.languages()
+        for language in d.languages:
+            if languages and language.name not in languages:
+                continue
+
+            searched.append(language)
+            messages += counts[language.name]['total']
+
+    if messages > indexes.max_messages:
+        raise SearchTooLarge(messages, indexes.max_messages)
+
+    results = []
+
+    for language in searched:
+        ids = language_index(language).search(query)
+        if not ids:
+            continue
+
+        values = language.values()
+        for id in ids[:limit - len(results)]:
+            results.append((language.domain.name, language.name, id,
+                            values.get(id, "")))
+
+        if len(results) >= limit:
+            return results
+
+    return results
+
+def update_index(event):
+    """Keep a cached search index current as its language is written."""
+
+    key = _index_key(event.language)
+
+    entry = indexes.peek(key)
+    if entry is None or entry[0] != event.stamp:
+        # not indexed, or out of date; it will be rebuilt when searched
+        return
+
+    entry[1].update(event.changes)
+    indexes.put(key, event.language.stamp(), entry[1])
+
+events.subscribe(update_index)
@@ -0,0 +1,128 @@
+"""Completion statistics.
+
+The number of translated, untranslated and identical (still matching
+the source language) messages in each language of a domain, and when
+each was last modified, are kept in the domain's metadata directory.
+The counters are updated whenever a language is written through the
+model, so the statistics for a domain are read from a single file
+rather than from every message of every language.  Each entry records
+the stamps of its language and of the source language; a language
+changed by other means, or whose source language has changed, is
+recounted from its status index when either stamp no longer matches.
+"""
+import time
+
+import cache
+import events
+import metadir
+import status
+
+STATS_FILE = 'stats.json'
+
+COUNTERS = ('total',) + status.STATUSES
+
+def source_stamp(domain):
+    """Return the stamp of the source language of domain, or None if
+    it has none."""
+
+    try:
+        return domain.get_language(status.SOURCE_LANGUAGE).stamp()
+    except KeyError:
+        return None
+
+def language_stats(language, last_modified=None):
+    """Return a dictionary of the counters for language."""
+
+    counts = language.status.counts()
+
+    result = dict(counts)
+    if language.name == status.SOURCE_LANGUAGE:
+        # the source language is complete by definition
+        result[status.TRANSLATED] += result[status.IDENTICAL]
+        result[status.IDENTICAL] = 0
+
+    result['total'] = sum(counts.values())
+    result['stamp'] = language.stamp()
+    result['source_stamp'] = source_stamp(language.domain)
+    result['last_modified'] = last_modified or language.store.mtime()
+
+    return result
+
+class DomainStats(object):
+    """The completion statistics of every language in a domain."""
+
+    def __init__(self, domain):
+
+        self.domain = domain
+        self.path = metadir.meta_path(domain.path, STATS_FILE)
+
+    def _data(self):
+
+        return cache.indexes.get(self.path, metadir.file_stamp(self.path),
+                                 lambda: metadir.read_json(self.path, {}))
+
+    def languages(self):
+        """Return a dictionary mapping each language name to a dictionary
+        of its counters and last_modified time."""
+
+        data = self._data()
+        languages = self.domain.languages
+        source = source_stamp(self.domain)
+
+        # the identical and translated counts depend on the source
+        # language as well
+        stale = [l for l in languages if l.name not in data or 
+                 data[l.name]['stamp'] != l.stamp() or
+                 data[l.name].get('source_stamp') != source]
+        if stale or len(data) != len(languages):
+            data = self._record(stale, [l.name for l in languages])
+
+        return data
+
+    def totals(self):
+        """Return the counters summed over every language, and the latest
+        last_modified time."""
+
+        languages = self.languages()
+
+        totals = dict([(c, sum([l[c] for l in languages.values()]))
+                       for c in COUNTERS])
+        totals['last_modified'] = max([0] + [l['last_modified'] 
+                                             for l in languages.values()])
+
+        return totals
+
+    def record(self, language, last_modified=None):
+        """Update the counters for language."""
+
+        self._record([language], last_modified=last_modified)
+
+    def _record(self, languages, names=None, last_modified=None):
+        """Recount languages and persist the result; if names is given,
+        drop any language not in it.  Returns the updated data."""
+
+        lock = metadir.lock(self.domain.path)
+        try:
+            data = metadir.read_json(self.path, {})
+
+            for language in languages:
+                data[language.name] = language_stats(language, last_modified)
+
+            if names is not None:
+                for name in data.keys():
+                    if name not in names:
+                        del data[name]
+
+            metadir.write_json(self.path, data)
+        finally:
+            metadir.unlock(lock)
+
+        return data
+
+def update_stats(event):
+    """Update the counters of a language as it is written; subscribed
+    after the status index, so its counts are current."""
+
+    DomainStats(event.language.domain).record(event.language, time.time())
+
+events.subscribe(update_stats)
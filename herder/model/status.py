@@ -0,0 +1,195 @@
+"""Translation status index.
+
+For every message in a language the index records whether it has been
+translated, is empty, or is still identical to the source language, so
+that listing untranslated strings doesn't require reading both
+languages.  The index is persisted in the language's metadata directory
+and validated against the stamps of both languages; writes made
+through the model update it incrementally, anything else causes it to
+be rebuilt on the next access.
+"""
+try:
+    from hashlib import md5
+except ImportError:
+    # Python 2.4
+    from md5 import new as md5
+
+import cache
+import events
+import metadir
+
+SOURCE_LANGUAGE = 'en'
+
+TRANSLATED = 'translated'
+UNTRANSLATED = 'untranslated'
+IDENTICAL = 'identical'
+
+STATUSES = (TRANSLATED, UNTRANSLATED, IDENTICAL)
+
+INDEX_FILE = 'status.json'
+
+def source_hash(value):
+    """Return a short hash identifying a source string."""
+
+    return md5(value.encode('utf-8')).hexdigest()[:16]
+
+def message_status(value, source_value):
+    """Return the status of a message given its value and the value of
+    the same message in the source language."""
+
+    if not value:
+        return UNTRANSLATED
+
+    if value == source_value:
+        return IDENTICAL
+
+    return TRANSLATED
+
+def index_size(data):
+    """Return the number of messages in the status index data, its size
+    in the index cache."""
+
+    return len(data['messages'])
+
+class StatusIndex(object):
+    """The status of every message in a language."""
+
+    def __init__(self, language):
+
+        self.language = language
+        self.path = metadir.meta_path(language._message_store, INDEX_FILE)
+
+    @property
+    def source(self):
+        """Return the source Language, or None if the domain has none."""
+
+        try:
+            return self.language.domain.get_language(SOURCE_LANGUAGE)
+        except KeyError:
+            return None
+
+    def _stamps(self, language_stamp=None):
+
+        if language_stamp is None:
+            language_stamp = self.language.stamp()
+
+        source = self.source
+        if source is None:
+            return [language_stamp, None]
+
+        return [language_stamp, source.stamp()]
+
+    def _load(self):
+        """Return the persisted index if it is current, otherwise
+        rebuild it."""
+
+        stamps = self._stamps()
+        data = metadir.read_json(self.path)
+
+        if data is None or data.get('stamps') != stamps:
+            data = self.rebuild(stamps)
+
+        return data
+
+    def data(self):
+        """Return the index: a dictionary with the stamps it was built
+        against, the per-status ``counts`` and a ``messages`` dictionary
+        mapping message id to a (status, source hash) pair.
+
+        The dictionary is shared with the cache and must not be
+        modified."""
+
+        return cache.indexes.get(self.path, tuple(self._stamps()), 
+                                 self._load, index_size)
+
+    def rebuild(self, stamps=None):
+        """Recompute the index from the message store and persist it."""
+
+        if stamps is None:
+            stamps = self._stamps()
+
+        source = self.source
+        if source is None:
+            source_values = {}
+        else:
+            source_values = source.values()
+
+        messages = {}
+        counts = dict([(status, 0) for status in STATUSES])
+
+        for id, value in self.language.values().iteritems():
+            source_value = source_values.get(id, "")
+            status = message_status(value, source_values.get(id))
+
+            messages[id] = (status, source_hash(source_value))
+            counts[status] += 1
+
+        data = dict(stamps=stamps, counts=counts, messages=messages)
+        metadir.write_json(self.path, data)
+
+        return data
+
+    def update(self, changes, stamp):
+        """Apply a sequence of (id, old value, new value) changes made
+        to a language whose stamp was stamp before the write."""
+
+        data = metadir.read_json(self.path)
+
+        if data is None or data.get('stamps') != self._stamps(stamp):
+            # the index was already out of date; rebuild it when needed
+            cache.indexes.invalidate(self.path)
+            return
+
+        source = self.source
+        if source is None:
+            source_values = {}
+        else:
+            source_values = source.values()
+
+        messages = data['messages']
+        counts = data['counts']
+
+        for id, old_value, new_value in changes:
+            if id in messages:
+                counts[messages[id][0]] -= 1
+
+            if new_value is None:
+                messages.pop(id, None)
+                continue
+
+            status = message_status(new_value, source_values.get(id))
+            messages[id] = (status, source_hash(source_values.get(id, "")))
+            counts[status] += 1
+
+        data['stamps'] = self._stamps()
+        metadir.write_json(self.path, data)
+        cache.indexes.put(self.path, tuple(data['stamps']), data,
+                          index_size(data))
+
+    def messages(self):
+        """Return a dictionary mapping message id to a (status, source
+        hash) pair."""
+
+        return self.data()['messages']
+
+    def status(self, id):
+        """Return the status of the message id."""
+
+        return self.messages()[id][0]
+
+    def counts(self):
+        """Return a dictionary mapping each status to the number of
+        messages with it."""
+
+        return self.data()['counts']
+
+def update_status(event):
+    """Keep the status index of a language current as it is written.
+
+    Writes to the source language change the status of the same message
+    in every other language; those indexes notice the new source stamp
+    and are rebuilt lazily."""
+
+    StatusIndex(event.language).update(event.changes, event.stamp)
+
+events.subscribe(update_status)
@@ -0,0 +1,325 @@
+"""Message storage backends.
+
+A language's messages are stored either as one ``.txt`` file per
+message (the format written by ``split_po.py``) or packed into a single
+append-only file.  The format is a property of the language directory:
+a directory containing a pack file is packed, anything else is read as
+individual files.  ``scripts/convert_store.py`` converts between them.
+"""
+import os
+import codecs
+import threading
+
+import counters
+from metadir import FILE_MODE, sync_dir, write_file
+
+PACK_FILE = 'messages.pack'
+
+def get_store(path):
+    """Return the store for the language directory at path."""
+
+    if os.path.exists(os.path.join(path, PACK_FILE)):
+        return PackedStore(path)
+
+    return FileStore(path)
+
+class FileStore(object):
+    """Messages stored as one ``{id}.txt`` file each."""
+
+    format = 'files'
+
+    def __init__(self, path):
+
+        self.path = path
+
+    def datafile_path(self, id):
+        """Return the file path used to store the message id."""
+
+        return os.path.join(self.path, id + '.txt')
+
+    def stamp(self):
+        """Return a token which changes when the store is modified."""
+
+        return '%.6f' % os.stat(self.path).st_mtime
+
+    def mtime(self):
+        """Return the time the store was last modified."""
+
+        return os.stat(self.path).st_mtime
+
+    def touch(self):
+        """Mark the store as modified."""
+
+        os.utime(self.path, None)
+
+    def load(self):
+        """Read every message; returns a dictionary mapping message ids to
+        values."""
+
+        values = {}
+
+        counters.count('listdir')
+        for filename in os.listdir(self.path):
+
+            if filename[-4:] != '.txt':
+                continue
+
+            values[filename[:-4].lower()] = self._read_file(
+                os.path.join(self.path, filename))
+
+        return values
+
+    def read(self, id):
+        """Return the value of the message id, or None if it is not
+        stored."""
+
+        if not os.path.exists(self.datafile_path(id)):
+            return None
+
+        return self._read_file(self.datafile_path(id))
+
+    def write_many(self, values):
+        """Write a dictionary of message id -> value; each file is replaced
+        atomically, so readers never see a partial write.
+
+        Every file is flushed to disk before it is renamed into place
+        (there is no way to flush several files at once), and the
+        directory is synced once for the batch."""
+
+        for id, value in values.iteritems():
+            write_file(self.datafile_path(id), value.encode('utf-8'),
+                       sync=True)
+        sync_dir(self.path)
+
+        # make sure the directory mtime changes, even within its resolution
+        self.touch()
+
+    def delete_many(self, ids):
+        """Remove the messages in the sequence ids."""
+
+        for id in ids:
+            if os.path.exists(self.datafile_path(id)):
+                counters.count('write')
+                os.remove(self.datafile_path(id))
+
+    def _read_file(self, path):
+
+        counters.count('open')
+        counters.count('read')
+        datafile = codecs.open(path, 'r', 'utf-8')
+        try:
+            return datafile.read()
+        finally:
+            datafile.close()
+
+class PackedStore(object):
+    """Messages stored in a single append-only file.
+
+    Each record is a header line giving the byte lengths of the id and
+    the value, followed by the UTF-8 encoded id and value and a newline;
+    the last record for an id wins and a value length of -1 marks the
+    message as deleted.  Single messages are read through an
+    in-memory offset index, which is extended incrementally as records
+    are appended (by this or any other process) and rebuilt when the
+    file is replaced by compaction."""
+
+    format = 'packed'
+
+    # path -> (device, inode, size, {id: (offset, length)})
+    _offsets = {}
+    _offsets_lock = threading.Lock()
+
+    def __init__(self, path):
+
+        self.path = path
+        self.pack_path = os.path.join(path, PACK_FILE)
+
+    def datafile_path(self, id):
+        """Return the file path used to store the message id."""
+
+        return self.pack_path
+
+    def stamp(self):
+        """Return a token which changes when the store is modified."""
+
+        st = os.stat(self.pack_path)
+        return '%.6f-%d-%d' % (st.st_mtime, st.st_ino, st.st_size)
+
+    def mtime(self):
+        """Return the time the store was last modified."""
+
+        return os.stat(self.pack_path).st_mtime
+
+    def touch(self):
+        """Mark the store as modified."""
+
+        os.utime(self.pack_path, None)
+
+    def create(self):
+        """Create an empty pack file, making this directory packed."""
+
+        os.close(os.open(self.pack_path, os.O_WRONLY | os.O_CREAT, FILE_MODE))
+
+    def load(self):
+        """Read every message with one sequential read; returns a
+        dictionary mapping message ids to values."""
+
+        counters.count('open')
+        counters.count('read')
+        pack = file(self.pack_path, 'rb')
+        try:
+            data = pack.read()
+        finally:
+            pack.close()
+
+        values = {}
+        for id, offset, length in _parse_records(data, 0)[0]:
+            if length < 0:
+                values.pop(id, None)
+            else:
+                values[id] = data[offset:offset + length].decode('utf-8')
+
+        return values
+
+    def read(self, id):
+        """Return the value of the message id, or None if it is not
+        stored."""
+
+        location = self._index().get(id)
+        if location is None or location[1] < 0:
+            return None
+
+        counters.count('open')
+        counters.count('read')
+        pack = file(self.pack_path, 'rb')
+        try:
+            pack.seek(location[0])
+            return pack.read(location[1]).decode('utf-8')
+        finally:
+            pack.close()
+
+    def write_many(self, values):
+        """Append a dictionary of message id -> value with a single write
+        and fsync."""
+
+        _append_records(self.pack_path, values)
+
+    def delete_many(self, ids):
+        """Append a deletion record for each id in the sequence ids."""
+
+        _append_records(self.pack_path, dict([(id, None) for id in ids]))
+
+    def compact(self):
+        """Rewrite the pack file keeping only the latest record for each
+        message.
+
+        Records appended while compaction runs are lost, so the caller
+        must ensure there are no concurrent writers."""
+
+        values = self.load()
+
+        temp_path = self.pack_path + '.compact'
+        os.close(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         FILE_MODE))
+        _append_records(temp_path, values)
+
+        os.rename(temp_path, self.pack_path)
+
+    def _index(self):
+        """Return the offset index, scanning only the records appended
+        since it was last extended."""
+
+        counters.count('open')
+        pack = file(self.pack_path, 'rb')
+        try:
+            st = os.fstat(pack.fileno())
+
+            self._offsets_lock.acquire()
+            try:
+                cached = self._offsets.get(self.path)
+            finally:
+                self._offsets_lock.release()
+
+            if cached is not None and cached[:2] == (st.st_dev, st.st_ino) \
+                    and cached[2] <= st.st_size:
+                if cached[2] == st.st_size:
+                    return cached[3]
+
+                start, offsets = cached[2], dict(cached[3])
+            else:
+                start, offsets = 0, {}
+
+            counters.count('read')
+            pack.seek(start)
+            data = pack.read(st.st_size - start)
+        finally:
+            pack.close()
+
+        records, consumed = _parse_records(data, start)
+        for id, offset, length in records:
+            offsets[id] = (offset, length)
+
+        self._offsets_lock.acquire()
+        try:
+            self._offsets[self.path] = (st.st_dev, st.st_ino,
+                                        start + consumed, offsets)
+        finally:
+            self._offsets_lock.release()
+
+        return offsets
+
+def _append_records(path, values):
+    """Append a record for each item in the dictionary values to the pack
+    file at path; a value of None records the deletion of the message."""
+
+    records = []
+    for id, value in values.iteritems():
+        id = id.encode('utf-8')
+
+        if value is None:
+            records.append('%d -1\n%s\n' % (len(id), id))
+        else:
+            value = value.encode('utf-8')
+            records.append('%d %d\n%s%s\n' % (len(id), len(value), 
+                                                id, value))
+
+    # a single write to a file opened for appending is not interleaved
+    # with other appenders
+    counters.count('open')
+    counters.count('write')
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, FILE_MODE)
+    try:
+        os.write(fd, "".join(records))
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _parse_records(data, base):
+    """Parse the records in data, which was read from a pack file starting
+    at offset base; returns a list of (id, offset, length) tuples and the
+    number of bytes consumed by complete records.  Deletion records have
+    a length of -1."""
+
+    records = []
+    pos = 0
+
+    while True:
+        header_end = data.find('\n', pos)
+        if header_end == -1:
+            break
+
+        id_length, value_length = [int(n) for n in
+                                   data[pos:header_end].split()]
+        id_start = header_end + 1
+        value_start = id_start + id_length
+        record_end = value_start + max(value_length, 0) + 1
+
+        if record_end > len(data):
+            # a partially written record at the end of the file
+            break
+
+        records.append((data[id_start:value_start].decode('utf-8'),
+                        base + value_start, value_length))
+        pos = record_end
+
+    return records, pos
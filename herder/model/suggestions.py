@@ -0,0 +1,221 @@
+"""Suggested translations.
+
+Users without the translate role submit suggestions rather than edits.
+Suggestions for a language are kept in a single append-only log in its
+metadata directory: one JSON record per line, either a new suggestion
+or the acceptance or rejection of an earlier one.  Reading every
+suggestion for a language is one sequential read of the log; the
+resulting index of pending suggestions by message id is cached in
+memory against the log's stamp.  Resolved suggestions are dropped by
+compaction, which runs automatically once they make up most of the log.
+"""
+import os
+import time
+
+import jsonlib
+
+import cache
+import counters
+import journal
+import message
+import metadir
+
+LOG_FILE = 'suggestions.log'
+
+ADD = 'add'
+ACCEPT = 'accept'
+REJECT = 'reject'
+
+# compact once the log holds this many resolved records, and more
+# resolved than pending ones
+COMPACT_THRESHOLD = 100
+
+class SuggestionLog(object):
+    """The suggestions for a language."""
+
+    def __init__(self, language):
+
+        self.language = language
+        self.path = metadir.meta_path(language._message_store, LOG_FILE)
+
+    def stamp(self):
+        """Return a token which changes whenever a suggestion is made,
+        accepted or rejected."""
+
+        return metadir.file_stamp(self.path)
+
+    def index(self):
+        """Return a dictionary with the ``pending`` suggestions, a
+        dictionary mapping each message id to a list of suggestions in
+        the order they were made, and the number of ``resolved`` records
+        in the log."""
+
+        return cache.indexes.get(self.path, self.stamp(), self._load,
+            lambda index: sum([len(s) for s in index['pending'].values()]))
+
+    def pending(self):
+        """Return a dictionary mapping message id to a list of pending
+        suggestions; each suggestion is a dictionary with the keys sid,
+        id, user, value and time."""
+
+        return self.index()['pending']
+
+    def for_message(self, id):
+        """Return the list of pending suggestions for message id."""
+
+        return self.pending().get(id, [])
+
+    def get(self, sid):
+        """Return the pending suggestion sid; raises KeyError if there is
+        no such suggestion."""
+
+        for suggestions in self.pending().values():
+            for suggestion in suggestions:
+                if suggestion['sid'] == sid:
+                    return suggestion
+
+        raise KeyError(sid)
+
+    def __len__(self):
+
+        return sum([len(s) for s in self.pending().values()])
+
+    def add(self, user, id, value):
+        """Record a suggestion of value for message id by user; returns
+        the new suggestion's id."""
+
+        sid = os.urandom(16).encode('hex')
+
+        # the version the suggestion is based on, checked when accepting
+        version = self.language.get_message(id).version
+        self._append([dict(op=ADD, sid=sid, id=id, user=user or '', 
+                           value=value, version=version, time=time.time())])
+        journal.record_suggestion(self.language, id, user or '', value)
+
+        return sid
+
+    def accept(self, sid, user):
+        """Store the suggestion sid as the translation of its message;
+        raises KeyError if it isn't pending, and EditConflict if the
+        message has been written since the suggestion was made.
+
+        The check, the write and the acceptance are made under the
+        language's lock, so a suggestion is accepted at most once and
+        never overwrites a concurrent edit."""
+
+        lock = metadir.lock(self.language._message_store)
+        try:
+            suggestion = self.get(sid)
+            id = suggestion['id']
+
+            # suggestions logged before versions were recorded aren't
+            # checked
+            version = suggestion.get('version')
+            if version is not None and \
+                    self.language.versions().get(id, 0) != version:
+                raise message.EditConflict([id])
+
+            self.language._write({id: suggestion['value']}, 'edit')
+            self._write_records([self._resolution(ACCEPT, sid, user)])
+        finally:
+            metadir.unlock(lock)
+
+        self._compact_if_needed()
+
+    def reject(self, sid, user):
+        """Discard the suggestion sid; raises KeyError if it isn't
+        pending."""
+
+        lock = metadir.lock(self.language._message_store)
+        try:
+            self.get(sid)
+            self._write_records([self._resolution(REJECT, sid, user)])
+        finally:
+            metadir.unlock(lock)
+
+        self._compact_if_needed()
+
+    def compact(self):
+        """Rewrite the log, keeping only the pending suggestions."""
+
+        lock = metadir.lock(self.language._message_store)
+        try:
+            records = [s for suggestions in self._load()['pending'].values()
+                       for s in suggestions]
+            records.sort(key=lambda s: s['time'])
+
+            data = "".join([jsonlib.write(dict(s, op=ADD)) + "\n" 
+                            for s in records])
+
+            # the log is the only copy of the pending suggestions
+            metadir.write_file(self.path, data, sync=True)
+        finally:
+            metadir.unlock(lock)
+
+    def _resolution(self, op, sid, user):
+
+        return dict(op=op, sid=sid, user=user or '', time=time.time())
+
+    def _compact_if_needed(self):
+
+        index = self.index()
+        if index['resolved'] > COMPACT_THRESHOLD and \
+                index['resolved'] > len(self):
+            self.compact()
+
+    def _append(self, records):
+
+        # hold the lock so records aren't lost to a concurrent compaction
+        lock = metadir.lock(self.language._message_store)
+        try:
+            self._write_records(records)
+        finally:
+            metadir.unlock(lock)
+
+    def _write_records(self, records):
+        """Append records to the log; the caller must hold the
+        language's lock."""
+
+        data = "".join([jsonlib.write(r) + "\n" for r in records])
+
+        counters.count('open')
+        counters.count('write')
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                     metadir.FILE_MODE)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def _load(self):
+
+        data = metadir.read_file(self.path, '')
+
+        pending = {}
+        by_sid = {}
+        resolved = 0
+
+        # ignore a partially written record at the end of the log
+        for line in data.split("\n")[:-1]:
+            try:
+                record = jsonlib.read(line, use_float=True)
+            except jsonlib.ReadError:
+                continue
+
+            if record['op'] == ADD:
+                suggestion = dict([(k, record[k]) for k in
+                                   ('sid', 'id', 'user', 'value', 'time')])
+                suggestion['version'] = record.get('version')
+                pending.setdefault(suggestion['id'], []).append(suggestion)
+                by_sid[suggestion['sid']] = suggestion
+
+            else:
+                resolved += 1
+                suggestion = by_sid.pop(record['sid'], None)
+                if suggestion is not None:
+                    resolved += 1
+                    pending[suggestion['id']].remove(suggestion)
+                    if not pending[suggestion['id']]:
+                        del pending[suggestion['id']]
+
+        return dict(pending=pending, resolved=resolved)
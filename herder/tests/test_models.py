@@ -0,0 +1,447 @@
+import os
+import shutil
+import codecs
+import tempfile
+from unittest import TestCase
+
+from pylons import config
+
+from herder.model import Domain, EditConflict
+from herder.model import cache, catalog, counters, journal, memory, \
+     registry, search, status, storage
+
+def write_messages(path, messages):
+    """Write a dictionary of message id -> value to a message store."""
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    for id, value in messages.items():
+        codecs.open(os.path.join(path, id + '.txt'), 'w', 'utf-8').write(value)
+
+class ModelTestCase(TestCase):
+    """Base class for tests which need a scratch translation domain."""
+
+    def setUp(self):
+
+        self.po_dir = tempfile.mkdtemp()
+        write_messages(os.path.join(self.po_dir, 'test', 'en'),
+                       {'hello': u'Hello', 'goodbye': u'Goodbye'})
+        write_messages(os.path.join(self.po_dir, 'test', 'es'),
+                       {'hello': u'Hola', 'goodbye': u'Goodbye'})
+
+        self.domain = Domain('test', os.path.join(self.po_dir, 'test'))
+        cache.messages.clear()
+
+    def tearDown(self):
+
+        shutil.rmtree(self.po_dir)
+
+class TestMessageCache(ModelTestCase):
+
+    def test_values(self):
+        es = self.domain.get_language('es')
+
+        self.assertEqual(len(es), 2)
+        self.assertEqual(es['hello'].string, u'Hola')
+        self.assert_(es.values() is es.values())
+
+    def test_update_invalidates(self):
+        es = self.domain.get_language('es')
+        es['goodbye'].update(u'Adios')
+
+        self.assertEqual(es['goodbye'].string, u'Adios')
+
+    def test_version(self):
+        es = self.domain.get_language('es')
+        version, domain_version = es.version(), self.domain.version()
+
+        es['goodbye'].update(u'Adios')
+        self.assertNotEqual(es.version(), version)
+        self.assertNotEqual(self.domain.version(), domain_version)
+
+    def test_eviction(self):
+        lru = cache.MessageCache(max_messages=3)
+        lru.put('en', 1, {'a': 1, 'b': 2})
+        lru.put('es', 1, {'a': 1, 'b': 2})
+
+        self.assertEqual(lru.get('en', 1, dict), {})
+        self.assertEqual(lru.get('es', 1, dict), {'a': 1, 'b': 2})
+
+    def test_index_size(self):
+        lru = cache.MessageCache(max_messages=3)
+        lru.put('status', 1, {'messages': {'a': 1, 'b': 2}}, 2)
+        lru.put('en', 1, {'a': 1, 'b': 2})
+
+        self.assertEqual(lru.peek('status'), None)
+
+        es = self.domain.get_language('es')
+        es.status.counts()
+        self.assertEqual(cache.indexes._sizes[es.status.path], 2)
+
+class TestDirectoryRegistry(ModelTestCase):
+
+    def test_languages(self):
+        self.assertEqual([l.name for l in self.domain.languages], ['en', 'es'])
+
+        # a new language is found without waiting for the check interval
+        write_messages(os.path.join(self.po_dir, 'test', 'fr'), {})
+        self.assertEqual(self.domain.get_language('fr').name, 'fr')
+
+        shutil.rmtree(os.path.join(self.po_dir, 'test', 'fr'))
+        registry.reload()
+        self.assertRaises(KeyError, self.domain.get_language, 'fr')
+
+class TestMessageVersions(ModelTestCase):
+
+    def test_compare_and_swap(self):
+        es = self.domain.get_language('es')
+        self.assertEqual(es.get_message('hello').version, 0)
+
+        es.update('hello', u'Buenos dias', version=0)
+        self.assertEqual(es.get_message('hello').version, 1)
+
+        self.assertRaises(EditConflict, es.update, 'hello', u'Hola', 
+                          version=0)
+        self.assertRaises(EditConflict, es.update, 'hello', u'Hola',
+                          old_value=u'Hola')
+
+        es.update('hello', u'Hola', old_value=u'Buenos dias')
+        self.assertEqual(es['hello'].string, u'Hola')
+        self.assertEqual(es.get_message('hello').version, 2)
+
+    def test_edit_many(self):
+        es = self.domain.get_language('es')
+        es.update('hello', u'Buenos dias')
+
+        conflicts = es.edit_many([('hello', u'Hola!', None, 0),
+                                  ('goodbye', u'Adios', u'Goodbye', None),
+                                  ('thanks', u'Gracias', None, None)])
+
+        self.assertEqual(conflicts, ['hello'])
+        self.assertEqual(es.values(), {'hello': u'Buenos dias', 
+                                       'goodbye': u'Adios',
+                                       'thanks': u'Gracias'})
+        self.assertEqual(es.generation, 2)
+
+    def test_recover(self):
+        es = self.domain.get_language('es')
+        path = os.path.join(self.po_dir, 'test', 'es', '.herder', 
+                            'versions.json')
+
+        es.update('hello', u'Buenos dias')
+        saved = open(path).read()
+        es.update('hello', u'Hola')
+
+        # lose the last write to the versions file, as a crash might
+        open(path, 'w').write(saved)
+        cache.indexes.clear()
+
+        self.assertEqual(es.get_message('hello').version, 2)
+        self.assertRaises(EditConflict, es.update, 'hello', u'Hola!', 
+                          version=1)
+
+class TestSuggestionLog(ModelTestCase):
+
+    def test_accept_reject(self):
+        es = self.domain.get_language('es')
+        first = es.suggest('alice', 'goodbye', u'Adios')
+        second = es.get_message('goodbye').suggest('bob', u'Chao')
+        es.suggest('bob', 'hello', u'Buenas')
+
+        self.assertEqual(len(es.suggestions), 3)
+        self.assertEqual([s['user'] for s in es['goodbye'].suggestions],
+                         ['alice', 'bob'])
+
+        es.suggestions.accept(first, 'admin')
+        es.suggestions.reject(second, 'admin')
+        self.assertEqual(es['goodbye'].string, u'Adios')
+        self.assertEqual(es['goodbye'].suggestions, [])
+        self.assertRaises(KeyError, es.suggestions.reject, second, 'admin')
+
+        es.suggestions.compact()
+        self.assertEqual(es.suggestions.index()['resolved'], 0)
+        self.assertEqual(es.suggestions.pending().keys(), ['hello'])
+
+    def test_accept_conflict(self):
+        es = self.domain.get_language('es')
+        sid = es.suggest('alice', 'hello', u'Buenas')
+        es.update('hello', u'Buenos dias')
+
+        self.assertRaises(EditConflict, es.suggestions.accept, sid, 'admin')
+        self.assertEqual(es['hello'].string, u'Buenos dias')
+        self.assertEqual(es.suggestions.get(sid)['value'], u'Buenas')
+
+class TestSearchIndex(ModelTestCase):
+
+    def test_search(self):
+        es = self.domain.get_language('es')
+        index = search.language_index(es)
+
+        self.assertEqual(index.search(u'hol'), ['hello'])
+        self.assertEqual(index.search(u'hola goodbye'), [])
+        self.assertEqual(index.search(u'GOOD'), ['goodbye'])
+
+        es.update_many({'goodbye': u'Hasta luego', 'thanks': u'Gracias'})
+        self.assert_(search.language_index(es) is index)
+        self.assertEqual(index.search(u'luego'), ['goodbye'])
+        self.assertEqual(index.search(u'grac'), ['thanks'])
+
+        es.delete_many(['thanks'])
+        self.assertEqual(index.search(u'grac'), [])
+
+    def test_too_large(self):
+        po_dir = config.get('herder.po_dir')
+        max_messages = config.get('herder.search.max_messages')
+
+        write_messages(os.path.join(self.po_dir, 'demo', 'es'),
+                       {'hello': u'Hola', 'goodbye': u'Adios'})
+        config['herder.po_dir'] = self.po_dir
+        config['herder.search.max_messages'] = '1'
+        try:
+            self.assertRaises(search.SearchTooLarge, search.search, u'hola')
+        finally:
+            config['herder.po_dir'] = po_dir
+            if max_messages is None:
+                del config['herder.search.max_messages']
+            else:
+                config['herder.search.max_messages'] = max_messages
+
+class TestTranslationMemory(ModelTestCase):
+
+    def test_matches(self):
+        # the memory covers every domain in po_dir
+        write_messages(os.path.join(self.po_dir, 'demo', 'en'),
+                       {'hello': u'Hello, world', 'hello-world': u'Hello world',
+                        'bye': u'Bye'})
+        write_messages(os.path.join(self.po_dir, 'demo', 'es'),
+                       {'hello': u'Hola', 'hello-world': u'', 'bye': u''})
+
+        po_dir = config.get('herder.po_dir')
+        config['herder.po_dir'] = self.po_dir
+        try:
+            es = Domain.by_name('demo').get_language('es')
+            matches = memory.matches(es, ['hello-world', 'bye'])
+        finally:
+            config['herder.po_dir'] = po_dir
+
+        self.assertEqual([m['translation'] for m in matches['hello-world']],
+                         [u'Hola'])
+        self.assert_(0 < matches['hello-world'][0]['score'] < 1)
+        self.assertEqual(matches['bye'], [])
+
+    def test_signature(self):
+        shingle_set = memory.shingles(u'Attribution-ShareAlike 3.0 Unported')
+        sig = memory.signature(shingle_set)
+
+        # each minhash picks its own shingle, not the same one for all
+        picked = set()
+        for (a, b), value in zip(memory.SEEDS, sig):
+            picked.update([s for s in shingle_set 
+                           if (a * (hash(s) % memory.PRIME) + b) % 
+                           memory.PRIME == value])
+        self.assert_(len(picked) > 4)
+
+        near = memory.shingles(u'Attribution-ShareAlike 3.0 Unported License')
+        self.assert_(set(memory.bands(sig)) & 
+                     set(memory.bands(memory.signature(near))))
+
+class TestDomainStats(ModelTestCase):
+
+    def test_counters(self):
+        es = self.domain.get_language('es')
+        self.assertEqual(es.stats['identical'], 1)
+
+        es.update_many({'goodbye': u'Adios', 'thanks': u''})
+        self.assertEqual(es.stats['translated'], 2)
+        self.assertEqual(es.stats['untranslated'], 1)
+
+        totals = self.domain.stats.totals()
+        self.assertEqual(totals['total'], 5)
+        self.assertEqual(totals['translated'], 4)
+
+    def test_source_changed(self):
+        es = self.domain.get_language('es')
+        self.assertEqual(es.stats['identical'], 1)
+
+        self.domain.get_language('en').update('goodbye', u'Bye now')
+        self.assertEqual(es.stats['translated'], 2)
+        self.assertEqual(es.stats['identical'], 0)
+        self.assertEqual(self.domain.stats.totals()['identical'], 0)
+
+class TestJournal(ModelTestCase):
+
+    def test_since(self):
+        es = self.domain.get_language('es')
+        changes = journal.Journal(self.domain)
+        self.assertEqual(changes.since(0), ([], 0))
+
+        es.update_many({'hello': u'Buenos dias', 'goodbye': u'Adios'})
+        es.suggest('alice', 'hello', u'Hola!')
+        self.domain.get_language('en').delete_many(['goodbye'])
+
+        records, last_seq = changes.since(0)
+        self.assertEqual(last_seq, 4)
+        self.assertEqual([r['type'] for r in records],
+                         ['update', 'update', 'suggest', 'delete'])
+
+        records, last_seq = changes.since(2, language='es')
+        self.assertEqual([(r['seq'], r['user']) for r in records],
+                         [(3, 'alice')])
+        self.assertEqual(last_seq, 4)
+        self.failIf(changes.wait(4, 0))
+
+    def test_limit(self):
+        es = self.domain.get_language('es')
+        changes = journal.Journal(self.domain)
+
+        es.update_many({'hello': u'Buenos dias'}, source='import')
+        self.domain.get_language('en').update('hello', u'Hi')
+        es.update('goodbye', u'Adios')
+
+        records, last_seq = changes.since(0, limit=1)
+        self.assertEqual([r['seq'] for r in records], [1])
+        self.assertEqual(last_seq, 1)
+        self.failIf('value' in records[0])
+
+        records, last_seq = changes.since(0, limit=2, language='es')
+        self.assertEqual([r['value'] for r in records[1:]], [u'Adios'])
+        self.assertEqual(last_seq, 3)
+
+    def test_recover(self):
+        es = self.domain.get_language('es')
+        changes = journal.Journal(self.domain)
+
+        es.update('hello', u'Buenos dias')
+        saved = open(changes.sequence_path).read()
+        es.update('goodbye', u'Adios')
+
+        # lose the last write to the sequence file, as a crash might
+        open(changes.sequence_path, 'w').write(saved)
+        self.assertEqual(changes.last_sequence(), 2)
+
+        es.update('thanks', u'Gracias')
+        self.assertEqual([r['seq'] for r in changes.since(0)[0]], [1, 2, 3])
+
+class TestCounters(ModelTestCase):
+
+    def test_io(self):
+        es = self.domain.get_language('es')
+        counters.count('open')
+        self.assertEqual(counters.stop(), {})
+
+        counters.start()
+        es.values()
+        es.values()
+        counts = counters.stop()
+
+        # the second read is served from the cache
+        self.assertEqual(counts['listdir'], 1)
+        self.assertEqual(counts['read'], 2)
+
+        counters.start()
+        es.update_many({'goodbye': u'Adios'})
+        self.assert_(counters.stop()['write'] >= 1)
+
+class TestLanguageJoin(ModelTestCase):
+
+    def test_join(self):
+        es = self.domain.get_language('es')
+        joined = dict([(id, values) for id, value, values in
+                       es.join(self.domain.get_languages(['en']))])
+
+        self.assertEqual(joined['hello'], {'es': u'Hola', 'en': u'Hello'})
+        self.assertEqual(len(joined), 2)
+
+class TestLanguageSelect(ModelTestCase):
+
+    def test_select(self):
+        en = self.domain.get_language('en')
+
+        self.assertEqual(list(en.select()), ['goodbye', 'hello'])
+        self.assertEqual(list(en.select(reverse=True)), ['hello', 'goodbye'])
+        self.assertEqual(list(en.select(after='goodbye')), ['hello'])
+        self.assertEqual(list(en.select(prefix='GO')), ['goodbye'])
+        self.assertEqual(list(en.select(prefix='x')), [])
+
+class TestStatusIndex(ModelTestCase):
+
+    def test_counts(self):
+        es = self.domain.get_language('es')
+
+        self.assertEqual(es.status.status('hello'), status.TRANSLATED)
+        self.assertEqual(es.status.status('goodbye'), status.IDENTICAL)
+
+        es.update('goodbye', u'Adios')
+        self.assertEqual(es.status.counts()[status.TRANSLATED], 2)
+        self.assertEqual(es.status.counts()[status.IDENTICAL], 0)
+
+class TestPackedStore(ModelTestCase):
+
+    def test_packed(self):
+        path = os.path.join(self.po_dir, 'test', 'fr')
+        os.makedirs(path)
+        storage.PackedStore(path).create()
+
+        fr = self.domain.get_language('fr')
+        self.assertEqual(fr.store.format, 'packed')
+
+        fr.update_many({'hello': u'Bonjour', 'goodbye': u'Au revoir'})
+        fr.update('hello', u'Salut')
+
+        cache.messages.clear()
+        self.assertEqual(fr['hello'].string, u'Salut')
+        self.assertEqual(fr.get_message('goodbye').string, u'Au revoir')
+        self.assertRaises(KeyError, fr.__getitem__, 'missing')
+
+        # single messages are read without loading the language
+        self.assertEqual(cache.messages.peek(fr._message_store), None)
+        self.assertEqual(fr.store.read('goodbye'), u'Au revoir')
+        self.assertEqual(fr.store.read('missing'), None)
+
+        fr.store.compact()
+        self.assertEqual(fr.store.load(), 
+                         {'hello': u'Salut', 'goodbye': u'Au revoir'})
+
+class TestImportManifest(ModelTestCase):
+
+    def test_sync(self):
+        es = self.domain.get_language('es')
+        catalog.ImportManifest(es).import_messages(
+            'test.po', 'a', [('hello', 'Hello', u'Hola'),
+                             ('goodbye', 'Goodbye', u'Goodbye')])
+
+        es.update('hello', u'Hola!')
+        report = catalog.ImportManifest(es).import_messages(
+            'test.po', 'b', [('hello', 'Hello', u'Buenos dias'),
+                             ('thanks', 'Thanks', u'Gracias')], sync=True)
+
+        self.assertEqual(report['conflicts'], ['hello'])
+        self.assertEqual(report['added'], ['thanks'])
+        self.assertEqual(report['removed'], ['goodbye'])
+        self.assertEqual(es.values(), {'hello': u'Hola!', 'thanks': u'Gracias'})
+        self.assertEqual(catalog.ImportManifest(es).digest('test.po'), 'b')
+
+    def test_sync_without_baseline(self):
+        es = self.domain.get_language('es')
+        report = catalog.ImportManifest(es).import_messages(
+            'test.po', 'a', [('hello', 'Hello', u'Buenos dias'),
+                             ('goodbye', 'Goodbye', u'Goodbye')], sync=True)
+
+        self.assertEqual(report['conflicts'], ['hello'])
+        self.assertEqual(report['changed'], [])
+        self.assertEqual(es.values(), {'hello': u'Hola', 'goodbye': u'Goodbye'})
+
+    def test_export(self):
+        es = self.domain.get_language('es')
+
+        path = catalog.export(es, 'po')
+        self.assertEqual(catalog.export(es, 'po'), path)
+        self.assert_('msgstr "Hola"' in file(path).read())
+
+        generation = es.generation
+        es.update('hello', u'Buenos dias')
+
+        self.assertEqual(es.generation, generation + 1)
+        self.assertNotEqual(catalog.export(es, 'po'), path)
+        self.failIf(os.path.exists(path))
@@ -35,11 +35,13 @@ def setup_config(command, filename, section, vars):
         # create default roles
         for role in CONTEXT_ROLES:
             users.role_create(role)
+        users.role_create('administrator')
 
         # create the default administrative user
         users.user_create("admin", password="acbd18db4cc2f85cedef654fccc4a4d8")
         for role in CONTEXT_ROLES:
             users.user_add_role('admin', role)
+        users.user_add_role('admin', 'administrator')
 
         # commit the user setup work
         session.flush()
@@ -0,0 +1,231 @@
+"""
+Usage:
+
+benchmark.py [options]
+
+Time the model and controller operations on the read path, and the
+split_po.py import, against a synthetic corpus generated by
+make_corpus.py.  Each operation is run --repeat times, both cold (with
+the in-process caches cleared before each run) and warm.
+
+The results, along with the corpus parameters, are written as JSON to
+--output (default stdout) so runs can be compared over time.
+"""
+
+import os
+import sys
+import time
+import urllib
+import shutil
+import platform
+import tempfile
+import optparse
+
+import jsonlib
+import pylons
+from StringIO import StringIO
+from paste.wsgiwrappers import WSGIRequest, WSGIResponse
+
+import make_corpus
+import split_po
+
+from herder.model import cache, registry
+from herder.model.domain import Domain
+from herder.controllers.language import LanguageController
+
+def clear_caches():
+    """Drop everything the model caches in-process."""
+
+    cache.messages.clear()
+    cache.indexes.clear()
+    registry.reload()
+
+def push_request(params=()):
+    """Make a request for the controller actions to read; returns the
+    pushed request."""
+
+    environ = {'REQUEST_METHOD': 'GET', 'SCRIPT_NAME': '', 'PATH_INFO': '/',
+               'QUERY_STRING': urllib.urlencode(params),
+               'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+               'wsgi.url_scheme': 'http', 'wsgi.input': StringIO('')}
+
+    request = WSGIRequest(environ)
+
+    pylons.request._push_object(request)
+    pylons.response._push_object(WSGIResponse())
+
+    return request
+
+def pop_request():
+
+    pylons.request._pop_object()
+    pylons.response._pop_object()
+
+def consume(result):
+    """Exhaust any generators in an action's result, as serializing the
+    response would."""
+
+    if isinstance(result, dict):
+        for value in result.values():
+            consume(value)
+    elif hasattr(result, 'next'):
+        for item in result:
+            pass
+
+    return result
+
+def time_operation(fn, repeat, cold):
+    """Run fn repeat times; returns a dictionary of timings in seconds."""
+
+    timings = []
+
+    for i in range(repeat):
+        if cold:
+            clear_caches()
+
+        start = time.time()
+        fn()
+        timings.append(time.time() - start)
+
+    return dict(min=min(timings), max=max(timings),
+                mean=sum(timings) / len(timings), runs=repeat)
+
+def model_operations(domain_name, language_name):
+    """Return a list of (name, function) pairs for the read path through
+    the model and controllers."""
+
+    def domain_all():
+        list(Domain.all())
+
+    def domain_languages():
+        for domain in Domain.all():
+            domain.languages
+
+    def language_iter():
+        for message in Domain.by_name(domain_name).get_language(
+                language_name):
+            pass
+
+    def message_string():
+        for message in Domain.by_name(domain_name).get_language(
+                language_name):
+            message.string
+
+    def controller_action(action, params):
+        def run():
+            push_request(params)
+            try:
+                consume(action(domain_name, language_name))
+            finally:
+                pop_request()
+
+        return run
+
+    controller = LanguageController()
+    return [('Domain.all', domain_all),
+            ('Domain.languages', domain_languages),
+            ('Language.__iter__', language_iter),
+            ('Message.string', message_string),
+            ('LanguageController._messages', 
+             controller_action(controller._messages, [])),
+            ('LanguageController._messages?lang=en', 
+             controller_action(controller._messages, [('lang', 'en')])),
+            ('LanguageController.untranslated_strings', 
+             controller_action(controller.untranslated_strings, 
+                               [('lang', 'en')])),
+            ]
+
+def benchmark_import(corpus, repeat):
+    """Time split_po.py importing the corpus as .po catalogs, both into
+    an empty po_dir and as a --sync of unchanged catalogs."""
+
+    src_dir = tempfile.mkdtemp()
+    dest_dir = tempfile.mkdtemp()
+    try:
+        make_corpus.write_po_files(src_dir, **corpus)
+
+        def run_import(sync):
+            def run():
+                for lang_dir, po_files in split_po.find_catalogs(src_dir, 
+                                                                 dest_dir):
+                    split_po.import_language((lang_dir, po_files, sync))
+
+            return run
+
+        results = {}
+        results['split_po'] = time_operation(run_import(False), 1, True)
+        results['split_po --sync'] = time_operation(run_import(True), 
+                                                    repeat, True)
+
+        return results
+    finally:
+        shutil.rmtree(src_dir)
+        shutil.rmtree(dest_dir)
+
+def run_benchmarks(corpus, repeat=5, po_dir=None, imports=True):
+    """Generate a corpus with the given make_corpus options (unless an
+    existing po_dir is given) and time each operation against it;
+    returns the results as a dictionary."""
+
+    results = dict(corpus=corpus, repeat=repeat,
+                   python=platform.python_version(),
+                   platform=platform.platform(),
+                   timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   cold={}, warm={})
+
+    temp_dir = None
+    if po_dir is None:
+        temp_dir = po_dir = tempfile.mkdtemp()
+        make_corpus.write_po_dir(po_dir, **corpus)
+
+    saved_po_dir = pylons.config.get('herder.po_dir')
+    pylons.config['herder.po_dir'] = po_dir
+    try:
+        clear_caches()
+        domain = Domain.all()[0]
+        language = [l.name for l in domain.languages if l.name != 'en'][0]
+        results['domain'], results['language'] = domain.name, language
+
+        for name, fn in model_operations(domain.name, language):
+            results['cold'][name] = time_operation(fn, repeat, True)
+
+            fn()
+            results['warm'][name] = time_operation(fn, repeat, False)
+
+        if imports:
+            results['cold'].update(benchmark_import(corpus, repeat))
+    finally:
+        pylons.config['herder.po_dir'] = saved_po_dir
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir)
+
+    return results
+
+if __name__ == '__main__':
+
+    parser = optparse.OptionParser(usage=__doc__)
+    make_corpus.add_options(parser)
+    parser.add_option('-r', '--repeat', type='int', default=5,
+                      help='number of times to run each operation')
+    parser.add_option('--po-dir', 
+                      help='benchmark an existing po_dir instead of '
+                      'generating one')
+    parser.add_option('--no-import', action='store_true', default=False,
+                      help="don't benchmark split_po.py")
+    parser.add_option('-o', '--output', 
+                      help='file to write the JSON results to')
+
+    options, args = parser.parse_args()
+
+    results = run_benchmarks(make_corpus.corpus_options(options),
+                             options.repeat, options.po_dir,
+                             not options.no_import)
+
+    if options.output:
+        output = file(options.output, 'w')
+        try:
+            output.write(jsonlib.write(results, indent='  '))
+        finally:
+            output.close()
+    else:
+        print(jsonlib.write(results, indent='  '))
@@ -0,0 +1,84 @@
+"""
+Usage:
+
+convert_store.py [--to=packed|files] [--compact] po_dir
+
+Convert every language in po_dir to the given storage format (packed by
+default).  With --compact, languages which are already packed have their
+pack files compacted.  The application should not be writing to po_dir
+while this runs.
+"""
+
+import os
+import sys
+import optparse
+
+from herder.model.domain import Domain
+from herder.model import storage
+
+def languages(po_dir):
+    """Yield each Language in po_dir."""
+
+    for name in sorted(os.listdir(po_dir)):
+        path = os.path.join(po_dir, name)
+
+        if name in Domain._IGNORE_DIRS or not os.path.isdir(path):
+            continue
+
+        for language in Domain(name, path).languages:
+            yield language
+
+def to_packed(language):
+    """Convert a language stored as individual files to a pack file."""
+
+    store = language.store
+    values = store.load()
+
+    # build the pack under a temporary name; renaming it into place is
+    # what switches the directory to the packed format
+    packed = storage.PackedStore(language._message_store)
+    temp_path = packed.pack_path + '.convert'
+    storage._append_records(temp_path, values)
+    os.rename(temp_path, packed.pack_path)
+
+    for id in values:
+        os.remove(store.datafile_path(id))
+
+def to_files(language):
+    """Convert a packed language to individual files."""
+
+    values = language.store.load()
+
+    storage.FileStore(language._message_store).write_many(values)
+    os.remove(language.store.pack_path)
+
+if __name__ == '__main__':
+
+    parser = optparse.OptionParser(usage=__doc__)
+    parser.add_option('--to', dest='format', default='packed',
+                      choices=['packed', 'files'],
+                      help='storage format to convert to')
+    parser.add_option('--compact', action='store_true', default=False,
+                      help='compact pack files which are already packed')
+
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('po_dir is required')
+
+    for language in languages(args[0]):
+        label = '%s/%s' % (language.domain.name, language.name)
+
+        if language.store.format == options.format:
+            if options.compact and options.format == 'packed':
+                language.store.compact()
+                print('%s: compacted' % label)
+
+            continue
+
+        if options.format == 'packed':
+            to_packed(language)
+        else:
+            to_files(language)
+
+        language.touch()
+        print('%s: converted to %s' % (label, options.format))
@@ -0,0 +1,47 @@
+"""
+Usage:
+
+export_po.py [--mo] po_dir output_dir
+
+Export every language in po_dir as a gettext catalog, written to
+output_dir/{domain}/{language}/{domain}.po (or .mo with --mo).  Catalogs
+are built from the same cache as the download view, so languages which
+haven't changed since they were last exported are simply copied.
+"""
+
+import os
+import sys
+import shutil
+import optparse
+
+from herder.model.domain import Domain
+from herder.model import catalog
+
+if __name__ == '__main__':
+
+    parser = optparse.OptionParser(usage=__doc__)
+    parser.add_option('--mo', dest='format', action='store_const',
+                      const='mo', default='po',
+                      help='write compiled .mo files instead of .po files')
+
+    options, args = parser.parse_args()
+    if len(args) != 2:
+        parser.error('po_dir and output_dir are required')
+
+    po_dir, output_dir = args
+
+    for name in sorted(os.listdir(po_dir)):
+        path = os.path.join(po_dir, name)
+
+        if name in Domain._IGNORE_DIRS or not os.path.isdir(path):
+            continue
+
+        for language in Domain(name, path).languages:
+            dest_dir = os.path.join(output_dir, name, language.name)
+            if not os.path.exists(dest_dir):
+                os.makedirs(dest_dir)
+
+            dest = os.path.join(dest_dir, '%s.%s' % (name, options.format))
+            shutil.copyfile(catalog.export(language, options.format), dest)
+
+            print(dest)
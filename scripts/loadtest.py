@@ -0,0 +1,356 @@
+"""
+Usage:
+
+loadtest.py [options]
+
+Replay a mix of requests through the complete WSGI stack built from a
+Paste config file (test.ini by default) -- static files, the registry,
+AuthKit, the SQLAlchemy manager and the Pylons controllers -- from
+--threads concurrent threads, and report the latency percentiles and
+throughput of each route.
+
+The mix is given as comma separated route=weight pairs; the routes are
+
+  list     the domain list
+  view     the language view
+  strings  the strings of a language, joined with the --lang languages
+  edit     edit_string, storing a new value for a random message
+
+Requests are made as --user, which must exist in the configured auth
+database (run with --setup to create it for a fresh database).  Each
+request carries the AuthKit ticket cookie a browser would have after
+logging in as that user, so checking the ticket and looking up the
+user's roles are part of every request; the login itself is not.  Unless
+--po-dir is given the requests run against a synthetic corpus generated
+by make_corpus.py; note that edits are written to the po_dir.
+"""
+
+import os
+import sys
+import math
+import time
+import random
+import shutil
+import urllib
+import tempfile
+import optparse
+import threading
+
+from StringIO import StringIO
+
+import jsonlib
+import pylons
+from paste.deploy import loadapp
+from paste.deploy.converters import asbool
+import paste.script.appinstall
+from authkit.authenticate.cookie import AuthKitTicket
+
+import make_corpus
+
+from herder.model.domain import Domain
+
+DEFAULT_MIX = 'list=1,view=2,strings=4,edit=1'
+
+# the address requests are made from
+REMOTE_ADDR = '127.0.0.1'
+
+def route_requests(domain, language, others, ids):
+    """Return a dictionary mapping route names to functions which take a
+    random number generator and return a (method, path, params) tuple
+    for a request to the route."""
+
+    base = '/domain/%s/language/%s/' % (domain, language)
+
+    def edit(rng):
+        data = dict(id=rng.choice(ids), 
+                    new_value=u'load test %d' % rng.randint(0, 1000000))
+        return 'POST', base + 'edit_string/', [('data', jsonlib.write(data))]
+
+    return {'list': lambda rng: ('GET', '/', []),
+            'view': lambda rng: ('GET', base + 'view/', []),
+            'strings': lambda rng: ('GET', base + 'strings/', 
+                                    [('lang', l) for l in others]),
+            'edit': edit,
+            }
+
+def parse_mix(mix):
+    """Parse a route=weight,... string into a list of (route, weight)
+    pairs."""
+
+    result = []
+    for item in mix.split(','):
+        route, weight = item.split('=')
+        result.append((route.strip(), int(weight)))
+
+    return result
+
+def auth_cookie(config, user):
+    """Return the Cookie header of a browser logged in as user, given
+    the application's configuration."""
+
+    if asbool(config.get('authkit.cookie.includeip', False)):
+        ip = REMOTE_ADDR
+    else:
+        ip = '0.0.0.0'
+
+    name = config.get('authkit.cookie.name', 'authkit')
+    ticket = AuthKitTicket(config['authkit.cookie.secret'], user, ip,
+                           cookie_name=name)
+
+    return ticket.cookie()[name].OutputString([])
+
+def make_environ(method, path, params, cookie):
+    """Return a WSGI environment for a request."""
+
+    body = ''
+    query = urllib.urlencode(params)
+    if method == 'POST':
+        body, query = query, ''
+
+    environ = {'REQUEST_METHOD': method,
+               'SCRIPT_NAME': '',
+               'PATH_INFO': path,
+               'QUERY_STRING': query,
+               'CONTENT_TYPE': 'application/x-www-form-urlencoded',
+               'CONTENT_LENGTH': str(len(body)),
+               'SERVER_NAME': 'localhost',
+               'SERVER_PORT': '80',
+               'SERVER_PROTOCOL': 'HTTP/1.0',
+               'HTTP_HOST': 'localhost',
+               'REMOTE_ADDR': REMOTE_ADDR,
+               'wsgi.version': (1, 0),
+               'wsgi.url_scheme': 'http',
+               'wsgi.input': StringIO(body),
+               'wsgi.errors': sys.stderr,
+               'wsgi.multithread': True,
+               'wsgi.multiprocess': False,
+               'wsgi.run_once': False,
+               }
+    if cookie:
+        environ['HTTP_COOKIE'] = cookie
+
+    return environ
+
+def call_app(app, environ):
+    """Make a request to app, reading the complete response; returns the
+    status code."""
+
+    status = []
+    def start_response(status_line, headers, exc_info=None):
+        status.append(status_line)
+        return lambda data: None
+
+    app_iter = app(environ, start_response)
+    try:
+        for chunk in app_iter:
+            pass
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+
+    return int(status[0].split()[0])
+
+def percentile(timings, fraction):
+    """Return the nearest-rank percentile of a sorted list of timings."""
+
+    if not timings:
+        return None
+
+    rank = int(math.ceil(fraction * len(timings)))
+    return timings[min(max(rank, 1), len(timings)) - 1]
+
+class LoadTest(object):
+    """Replays requests against a WSGI application from several threads
+    and collects the time taken by each."""
+
+    def __init__(self, app, routes, mix, cookie=None, seed=0):
+
+        self.app = app
+        self.routes = routes
+        self.cookie = cookie
+        self.seed = seed
+
+        # a list of route names, each repeated by its weight
+        self.schedule = []
+        for route, weight in mix:
+            if route not in routes:
+                raise ValueError('unknown route %s' % route)
+            self.schedule.extend([route] * weight)
+
+        self.timings = dict([(route, []) for route, weight in mix])
+        self.errors = dict([(route, 0) for route, weight in mix])
+        self._lock = threading.Lock()
+        self._remaining = 0
+
+    def _take(self):
+        """Claim one of the remaining requests; returns False once they
+        have all been made."""
+
+        self._lock.acquire()
+        try:
+            if self._remaining <= 0:
+                return False
+
+            self._remaining -= 1
+            return True
+        finally:
+            self._lock.release()
+
+    def _worker(self, n):
+
+        rng = random.Random(self.seed + n)
+        timings = dict([(route, []) for route in self.timings])
+        errors = dict([(route, 0) for route in self.errors])
+
+        while self._take():
+            route = rng.choice(self.schedule)
+            environ = make_environ(*(self.routes[route](rng) + 
+                                     (self.cookie,)))
+
+            start = time.time()
+            try:
+                status = call_app(self.app, environ)
+            except Exception:
+                status = 500
+            timings[route].append(time.time() - start)
+
+            if status >= 400:
+                errors[route] += 1
+
+        self._lock.acquire()
+        try:
+            for route in timings:
+                self.timings[route].extend(timings[route])
+                self.errors[route] += errors[route]
+        finally:
+            self._lock.release()
+
+    def run(self, requests, threads=1):
+        """Make requests requests from threads threads; returns the
+        elapsed time in seconds."""
+
+        self._remaining = requests
+
+        workers = [threading.Thread(target=self._worker, args=(n,))
+                   for n in range(threads)]
+
+        start = time.time()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        return time.time() - start
+
+    def report(self, elapsed):
+        """Return a dictionary of statistics for each route, plus a
+        ``total`` entry covering every request."""
+
+        report = {}
+        everything = []
+
+        for route, timings in self.timings.items():
+            everything.extend(timings)
+            report[route] = self._summarize(sorted(timings), 
+                                            self.errors[route], elapsed)
+
+        report['total'] = self._summarize(sorted(everything), 
+                                          sum(self.errors.values()), elapsed)
+
+        return report
+
+    def _summarize(self, timings, errors, elapsed):
+
+        return dict(requests=len(timings), errors=errors,
+                    rps=len(timings) / elapsed,
+                    p50=percentile(timings, 0.50),
+                    p95=percentile(timings, 0.95),
+                    p99=percentile(timings, 0.99),
+                    max=percentile(timings, 1.0))
+
+def print_report(report):
+    """Print a report, one route per line."""
+
+    print('%-10s %9s %7s %9s %9s %9s %9s %9s' % (
+            'route', 'requests', 'errors', 'req/s', 'p50', 'p95', 'p99', 
+            'max'))
+
+    routes = sorted([r for r in report if r != 'total']) + ['total']
+    for route in routes:
+        stats = report[route]
+        if not stats['requests']:
+            continue
+
+        print('%-10s %9d %7d %9.1f %8.1fms %8.1fms %8.1fms %8.1fms' % (
+                route, stats['requests'], stats['errors'], stats['rps'],
+                stats['p50'] * 1000, stats['p95'] * 1000, 
+                stats['p99'] * 1000, stats['max'] * 1000))
+
+if __name__ == '__main__':
+
+    parser = optparse.OptionParser(usage=__doc__)
+    make_corpus.add_options(parser)
+    parser.add_option('-c', '--config', default='test.ini',
+                      help='Paste config file to build the application from')
+    parser.add_option('--setup', action='store_true', default=False,
+                      help='run setup-app on the config file first')
+    parser.add_option('-t', '--threads', type='int', default=4,
+                      help='number of concurrent threads')
+    parser.add_option('-n', '--requests', type='int', default=1000,
+                      help='total number of requests to make')
+    parser.add_option('--mix', default=DEFAULT_MIX,
+                      help='route=weight pairs (default %s)' % DEFAULT_MIX)
+    parser.add_option('-u', '--user', default='admin',
+                      help='user to make requests as')
+    parser.add_option('--lang', action='append', default=None,
+                      help='additional language for strings requests '
+                      '(default en)')
+    parser.add_option('--po-dir', 
+                      help='use an existing po_dir instead of generating one')
+    parser.add_option('-o', '--output', 
+                      help='file to write the JSON report to')
+
+    options, args = parser.parse_args()
+    config_file = os.path.abspath(options.config)
+
+    if options.setup:
+        paste.script.appinstall.SetupCommand('setup-app').run([config_file])
+
+    app = loadapp('config:' + config_file)
+
+    temp_dir = None
+    po_dir = options.po_dir
+    if po_dir is None:
+        temp_dir = po_dir = tempfile.mkdtemp()
+        make_corpus.write_po_dir(po_dir, 
+                                 **make_corpus.corpus_options(options))
+
+    pylons.config['herder.po_dir'] = os.path.abspath(po_dir)
+    try:
+        domain = Domain.all()[0]
+        language = [l for l in domain.languages if l.name != 'en'][0]
+
+        routes = route_requests(domain.name, language.name, 
+                                options.lang or ['en'], language.ids())
+        load = LoadTest(app, routes, parse_mix(options.mix), 
+                        auth_cookie(pylons.config, options.user),
+                        options.seed)
+
+        elapsed = load.run(options.requests, options.threads)
+        report = load.report(elapsed)
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir)
+
+    print_report(report)
+
+    if options.output:
+        output = file(options.output, 'w')
+        try:
+            output.write(jsonlib.write(
+                    dict(config=options.config, threads=options.threads,
+                         mix=options.mix, domain=domain.name, 
+                         language=language.name, elapsed=elapsed,
+                         routes=report), indent='  '))
+        finally:
+            output.close()
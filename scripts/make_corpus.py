@@ -0,0 +1,145 @@
+"""
+Usage:
+
+make_corpus.py [options] output_dir
+
+Generate a synthetic translation corpus for benchmarking: --domains
+domains, each with the en source language and --languages others, each
+containing --messages messages of about --length characters.  A
+fraction of the messages in each language (--untranslated) is left
+untranslated or identical to the source string.
+
+By default the corpus is written as a po_dir, with one .txt file per
+message; with --po it is written as .po catalogs, in the layout
+split_po.py imports.
+"""
+
+import os
+import sys
+import codecs
+import random
+import optparse
+
+from babel.messages.catalog import Catalog
+import babel.messages.pofile
+
+WORDS = """the of and to in is you that it he was for on are as with his
+they at be this have from or one had by word but not what all were we
+when your can said there use an each which she do how their if will up
+other about out many then them these so some her would make like him
+into time has look two more write go see number no way could people my
+than first water been call who oil its now find long down day did get
+come made may part license work share attribution commercial creative
+commons rights reserved""".split()
+
+def make_string(rng, length):
+    """Return a random string of roughly length characters."""
+
+    words = []
+    size = 0
+    while size < length:
+        words.append(rng.choice(WORDS))
+        size += len(words[-1]) + 1
+
+    return " ".join(words).capitalize()
+
+def make_catalogs(domains=2, languages=5, messages=1000, length=40,
+                  untranslated=0.2, seed=0):
+    """Yield a (domain name, language name, [(message id, msgid, value)])
+    tuple for each language of a synthetic corpus."""
+
+    rng = random.Random(seed)
+    language_names = ['en'] + ['l%02d' % n for n in range(languages)]
+
+    for d in range(domains):
+        domain = 'domain%02d' % d
+        source = [('msg%06d' % n, make_string(rng, length))
+                  for n in range(messages)]
+
+        for lang in language_names:
+            values = []
+
+            for id, msgid in source:
+                if lang == 'en':
+                    value = msgid
+                elif rng.random() < untranslated:
+                    value = rng.choice(['', msgid])
+                else:
+                    value = make_string(rng, length)
+
+                values.append((id, msgid, value))
+
+            yield domain, lang, values
+
+def write_po_dir(output_dir, **options):
+    """Write a synthetic corpus to output_dir as a po_dir."""
+
+    for domain, lang, values in make_catalogs(**options):
+        path = os.path.join(output_dir, domain, lang)
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        for id, msgid, value in values:
+            datafile = codecs.open(os.path.join(path, id + '.txt'), 'w',
+                                   'utf-8')
+            try:
+                datafile.write(value)
+            finally:
+                datafile.close()
+
+def write_po_files(output_dir, **options):
+    """Write a synthetic corpus to output_dir as .po catalogs."""
+
+    for domain, lang, values in make_catalogs(**options):
+        path = os.path.join(output_dir, domain, lang)
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        catalog = Catalog(domain=domain, fuzzy=False)
+        for id, msgid, value in values:
+            catalog.add(msgid, value)
+
+        po_file = file(os.path.join(path, domain + '.po'), 'w')
+        try:
+            babel.messages.pofile.write_po(po_file, catalog)
+        finally:
+            po_file.close()
+
+def add_options(parser):
+    """Add the corpus options to an OptionParser."""
+
+    parser.add_option('--domains', type='int', default=2,
+                      help='number of domains')
+    parser.add_option('--languages', type='int', default=5,
+                      help='number of languages besides en in each domain')
+    parser.add_option('--messages', type='int', default=1000,
+                      help='number of messages in each language')
+    parser.add_option('--length', type='int', default=40,
+                      help='approximate length of each string')
+    parser.add_option('--untranslated', type='float', default=0.2,
+                      help='fraction of messages left untranslated')
+    parser.add_option('--seed', type='int', default=0,
+                      help='random seed')
+
+def corpus_options(options):
+    """Return the corpus options from parsed options as a dictionary."""
+
+    return dict(domains=options.domains, languages=options.languages,
+                messages=options.messages, length=options.length,
+                untranslated=options.untranslated, seed=options.seed)
+
+if __name__ == '__main__':
+
+    parser = optparse.OptionParser(usage=__doc__)
+    add_options(parser)
+    parser.add_option('--po', action='store_true', default=False,
+                      help='write .po catalogs instead of a po_dir')
+
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('output_dir is required')
+
+    if options.po:
+        write_po_files(args[0], **corpus_options(options))
+    else:
+        write_po_dir(args[0], **corpus_options(options))
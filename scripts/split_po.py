@@ -1,16 +1,38 @@
 """
 Usage:
 
-split_po.py [source_dir] [output_dir]
+split_po.py [--jobs=N] [--sync] [source_dir] [output_dir]
+
+With --jobs, catalogs are parsed and written by N worker processes.
+With --sync, catalogs which have not changed since the last import are
+skipped, and only messages changed upstream are written; translations
+edited in herder since the last import are kept, and reported as
+conflicts if they were changed upstream as well.  Translations which
+differ from a catalog never imported before are kept as conflicts too,
+since herder can't tell whether they were edited.
+
+A summary of the time spent on, and changes made by, each catalog is
+printed when the import completes.
 """
 
 import os
 import sys
-import codecs
+import time
 import string
+import optparse
+try:
+    from hashlib import sha1
+except ImportError:
+    # Python 2.4
+    from sha import new as sha1
+
+from StringIO import StringIO
 
 import babel.messages.pofile
 
+from herder.model.domain import Domain
+from herder.model.catalog import ImportManifest
+
 def message_fn(msg):
     """Return the file path used to store this message value."""
 
@@ -22,16 +44,17 @@ def message_fn(msg):
 
     if len(words) == 1:
         return words[0] + '.txt'
-    
+
     filename = "-".join([''] + words[:4] + [str(abs(hash(msg.id)))])
     filename += ".txt"
 
     return filename
 
-if __name__ == '__main__':
+def find_catalogs(src_dir, dest_dir):
+    """Walk src_dir and return a list of (language directory, [.po
+    paths]) pairs, creating the language directories in dest_dir."""
 
-    src_dir = sys.argv[-2]
-    dest_dir = sys.argv[-1]
+    catalogs = []
 
     for root, dirs, files in os.walk(src_dir):
 
@@ -39,19 +62,126 @@ if __name__ == '__main__':
         if '.svn' in dirs:
             del dirs[dirs.index('.svn')]
 
-        mid_dir = root[len(src_dir):]
+        mid_dir = root[len(src_dir):].lstrip(os.sep)
 
         if not os.path.exists(os.path.join(dest_dir, mid_dir)):
             os.makedirs(os.path.join(dest_dir, mid_dir))
 
-        for fn in files:
-            if fn[-3:] == '.po':
-                # process this file
-                catalog = babel.messages.pofile.read_po(
-                    file(os.path.join(root, fn), 'r'))
+        po_files = [os.path.join(root, fn) for fn in files if fn[-3:] == '.po']
+        if po_files:
+            catalogs.append(
+                (os.path.normpath(os.path.join(dest_dir, mid_dir)), po_files))
+
+    return catalogs
+
+def import_language(job):
+    """Import the .po files for a single language directory; returns a
+    list of (.po path, message count, parse time, write time, report)
+    tuples, where report is None for a catalog skipped by a sync.
+
+    All of a language's catalogs are handled by the same worker so that
+    no two processes write to one language at the same time."""
+
+    lang_dir, po_files, sync = job
+    timings = []
+
+    domain_dir = os.path.dirname(lang_dir)
+    language = Domain(os.path.basename(domain_dir), domain_dir
+                      ).get_language(os.path.basename(lang_dir))
+    manifest = ImportManifest(language)
+
+    for po_path in po_files:
+        start = time.time()
+        name = os.path.basename(po_path)
+
+        po_file = file(po_path, 'r')
+        try:
+            contents = po_file.read()
+        finally:
+            po_file.close()
+
+        digest = sha1(contents).hexdigest()
+        if sync and manifest.digest(name) == digest:
+            timings.append((po_path, 0, time.time() - start, 0, None))
+            continue
 
-                for msg in catalog:
-                    codecs.open(os.path.join(dest_dir, mid_dir, message_fn(msg)), 
-                                'w', 'utf-8').write(msg.string)
+        catalog = babel.messages.pofile.read_po(StringIO(contents))
+        messages = [(message_fn(msg)[:-4], msg.id, msg.string) 
+                    for msg in catalog]
+        parsed = time.time()
 
+        # write through the model so that derived indexes are updated and
+        # running servers notice the change
+        report = manifest.import_messages(name, digest, messages, sync)
+
+        timings.append((po_path, len(messages), parsed - start,
+                        time.time() - parsed, report))
+
+    return timings
+
+def print_summary(timings, elapsed):
+    """Print the per-catalog timings, slowest first, followed by any
+    conflicts."""
+
+    timings = sorted(timings, key=lambda t: t[2] + t[3], reverse=True)
+
+    print('%9s %9s %9s %23s  %s' % ('parse', 'write', 'messages', 
+                                    'added/changed/removed', 'catalog'))
+    for po_path, count, parse_time, write_time, report in timings:
+        if report is None:
+            changes = 'unchanged'
+        else:
+            changes = '%d/%d/%d' % (len(report['added']),
+                                    len(report['changed']),
+                                    len(report['removed']))
+
+        print('%8.3fs %8.3fs %9d %23s  %s' % (parse_time, write_time, count,
+                                              changes, po_path))
+
+    print('%d catalogs, %d messages in %.3fs' % (
+            len(timings), sum([t[1] for t in timings]), elapsed))
+
+    for po_path, count, parse_time, write_time, report in timings:
+        if report is not None and report['conflicts']:
+            print('\n%s: kept %d edited translations changed or removed upstream:' % (
+                    po_path, len(report['conflicts'])))
+
+            for id in sorted(report['conflicts']):
+                print('  %s' % id)
+
+if __name__ == '__main__':
 
+    parser = optparse.OptionParser(usage=__doc__)
+    parser.add_option('-j', '--jobs', type='int', default=1,
+                      help='number of worker processes to import with')
+    parser.add_option('--sync', action='store_true', default=False,
+                      help='only import changes made since the last import')
+
+    options, args = parser.parse_args()
+    if len(args) != 2:
+        parser.error('source_dir and output_dir are required')
+
+    src_dir, dest_dir = args
+    start = time.time()
+
+    jobs = [(lang_dir, po_files, options.sync) for lang_dir, po_files in
+            find_catalogs(src_dir, dest_dir)]
+
+    if options.jobs > 1:
+        try:
+            import multiprocessing
+        except ImportError:
+            parser.error('--jobs requires Python 2.6 or the multiprocessing '
+                         'package')
+
+        pool = multiprocessing.Pool(options.jobs)
+        try:
+            results = pool.map(import_language, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [import_language(job) for job in jobs]
+
+    print_summary([t for result in results for t in result],
+                  time.time() - start)